@@ -0,0 +1,94 @@
+"""Limite de banda total dos downloads (token bucket compartilhado)"""
+import time
+import threading
+from config import BANDWIDTH_LIMIT, BANDWIDTH_SCHEDULE, BANDWIDTH_BURST
+from metrics import metrics
+
+def parse_clock(value):
+    """Converte "HH:MM" em minutos desde a meia-noite."""
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def scheduled_rate(schedule, moment=None):
+    """Retorna (True, limite) da janela da agenda que vale agora, ou (False, None).
+
+    Cada entrada é (início, fim, bytes/s ou None); uma janela com fim antes do
+    início atravessa a meia-noite.
+    """
+    moment = time.localtime() if moment is None else moment
+    now = moment.tm_hour * 60 + moment.tm_min
+    for start, end, rate in schedule:
+        start, end = parse_clock(start), parse_clock(end)
+        inside = start <= now < end if start <= end else (now >= start or now < end)
+        if inside:
+            return True, rate
+    return False, None
+
+class BandwidthLimiter:
+    """Token bucket em bytes/s dividido por todos os downloads em andamento.
+
+    Cada pedaço recebido reserva o seu tempo no link (tamanho / limite) após as
+    reservas anteriores, e quem pediu espera até o fim da reserva; até burst
+    bytes passam sem espera depois de um período ocioso. As reservas seguem a
+    ordem de chegada, então a vazão fica constante em vez de alternar rajadas e
+    pausas. Arquivos pequenos (priority) têm uma fila própria, também no ritmo do
+    limite, e não esperam atrás dos grandes: o tempo que usam empurra as
+    reservas dos grandes para depois, e o total continua dentro do limite.
+    """
+
+    def __init__(self, rate=BANDWIDTH_LIMIT, schedule=BANDWIDTH_SCHEDULE, burst=BANDWIDTH_BURST):
+        self.schedule = list(schedule or [])
+        self.burst = burst
+        self._base_rate = rate
+        self._override = None
+        self._link_free_at = 0.0
+        self._priority_free_at = 0.0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """Muda o limite durante a execução (None = sem limite), acima da agenda."""
+        with self._lock:
+            self._override = (rate,)
+        print(f"📶 Limite de banda: {format_rate(rate)}")
+
+    def reset_rate(self):
+        """Volta a usar BANDWIDTH_LIMIT e a agenda."""
+        with self._lock:
+            self._override = None
+        print(f"📶 Limite de banda: {format_rate(self.current_rate())} (configuração)")
+
+    def current_rate(self):
+        """Limite em vigor agora, em bytes/s (None = sem limite)."""
+        if self._override is not None:
+            return self._override[0]
+        found, rate = scheduled_rate(self.schedule) if self.schedule else (False, None)
+        return rate if found else self._base_rate
+
+    def consume(self, size, priority=False):
+        """Reserva o tempo de size bytes no link e espera o necessário para respeitar o limite."""
+        rate = self.current_rate()
+        metrics.set_gauge('bandwidth_limit_bytes', rate or 0)
+        if not rate:
+            return
+
+        cost = size / rate
+        # Crédito acumulado no máximo por burst bytes de ociosidade
+        idle_credit = self.burst / rate
+        with self._lock:
+            now = time.monotonic()
+            self._link_free_at = max(self._link_free_at, now - idle_credit) + cost
+            if priority:
+                self._priority_free_at = max(self._priority_free_at, now - idle_credit) + cost
+                delay = self._priority_free_at - now
+            else:
+                delay = self._link_free_at - now
+
+        if delay > 0:
+            metrics.inc('bandwidth_wait_seconds', delay)
+            time.sleep(delay)
+
+def format_rate(rate):
+    return "sem limite" if not rate else f"{rate / (1024 * 1024):.2f} MB/s"
+
+# Limitador único de banda para todos os downloads do processo
+bandwidth_limiter = BandwidthLimiter()
@@ -0,0 +1,203 @@
+"""Benchmark do downloader contra o cliente falso (sem acessar o Telegram)
+
+Uso: python benchmark.py [--messages N] [--topics N] [--files N] [--latency S]
+                         [--bandwidth MB/s] [--flood-rate P] [--json saida.json]
+                         [--compare anterior.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import downloader
+from fake_client import FakeTelegramClient, generate_history
+from cache_manager import load_messages_from_cache, get_topic_messages_native, search_media_records
+from progress_journal import ProgressJournal
+from rate_limiter import history_limiter
+from utils import DirectoryIndex, FilenamePlanner
+
+try:
+    import resource
+except ImportError:
+    # Windows não tem o módulo resource: o pico de memória não é medido
+    resource = None
+
+CHAT_TITLE = "Benchmark"
+
+def peak_rss_mb():
+    """Pico de memória residente do processo até agora, em MB (None se indisponível)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silencia as mensagens do downloader durante a medição."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+def measure(name, func, unit_counter, quiet_output=True):
+    """Executa func e retorna o resultado do cenário com tempo e taxa."""
+    started = time.perf_counter()
+    with quiet(quiet_output):
+        result = func()
+    seconds = time.perf_counter() - started
+    units = unit_counter(result)
+    row = {'scenario': name, 'seconds': round(seconds, 3)}
+    for unit, amount in units.items():
+        row[unit] = amount
+        row[f"{unit}_per_second"] = round(amount / seconds, 1) if seconds else None
+    return row
+
+def run_benchmarks(args):
+    if not args.pacing:
+        # Sem o ritmo entre páginas mede-se só o custo do próprio código
+        history_limiter.interval = history_limiter.min_interval = 0.0
+
+    messages = generate_history(args.messages, topics=args.topics, size_scale=args.size_scale, seed=args.seed)
+    client = FakeTelegramClient(messages, title=CHAT_TITLE, latency=args.latency,
+                                bandwidth=args.bandwidth * 1024 * 1024 if args.bandwidth else None,
+                                flood_wait_rate=args.flood_rate, flood_wait_seconds=args.flood_seconds,
+                                seed=args.seed)
+    chat_id = client.chat_id
+    results = []
+
+    results.append(measure(
+        'fetch_history',
+        lambda: list(downloader.stream_history_records(client, chat_id, CHAT_TITLE)),
+        lambda records: {'messages': len(records)}, args.quiet
+    ))
+
+    # O mesmo histórico pelo scanner de faixas de IDs (num cache separado)
+    results.append(measure(
+        'fetch_history_ids',
+        lambda: list(downloader.scan_history_by_ids(client, chat_id, f"{CHAT_TITLE}_ids")),
+        lambda records: {'messages': len(records)}, args.quiet
+    ))
+
+    # Só as mídias, pela busca filtrada do servidor (num cache separado)
+    results.append(measure(
+        'fetch_search',
+        lambda: list(search_media_records(client, chat_id, f"{CHAT_TITLE}_search",
+                                          list(downloader.MEDIA_KIND_CHOICES))),
+        lambda records: {'messages': len(records)}, args.quiet
+    ))
+
+    results.append(measure(
+        'load_cache',
+        lambda: load_messages_from_cache(chat_id, CHAT_TITLE)['messages'],
+        lambda records: {'messages': len(records)}, args.quiet
+    ))
+    with quiet(args.quiet):
+        records = load_messages_from_cache(chat_id, CHAT_TITLE)['messages']
+
+    if args.topics:
+        topic_id = messages[-1].message_thread_id
+        results.append(measure(
+            'fetch_topic',
+            lambda: list(get_topic_messages_native(client, chat_id, topic_id, CHAT_TITLE)),
+            lambda topic_records: {'messages': len(topic_records)}, args.quiet
+        ))
+
+    def precheck():
+        journal = ProgressJournal(CHAT_TITLE, chat_id, verbose=False)
+        try:
+            directory = os.path.join('downloads', CHAT_TITLE)
+            planner = FilenamePlanner(directory, journal.file_names(), journal.record_file_name)
+            downloader.count_existing_files(records, journal, DirectoryIndex(directory), planner)
+        finally:
+            journal.close()
+        return records
+
+    results.append(measure('precheck', precheck, lambda checked: {'messages': len(checked)}, args.quiet))
+
+    # Downloads: as primeiras args.files mídias, gravadas de verdade no disco
+    media_records = [record for record in records if record.media_kind][:args.files]
+
+    def download():
+        return downloader.run_download_pool(client, media_records, CHAT_TITLE, chat_id)
+
+    downloaded_bytes = sum(record.file_size for record in media_records)
+    results.append(measure(
+        'download',
+        download,
+        lambda stats: {'files': stats['downloaded'], 'mb': round(downloaded_bytes / (1024 * 1024), 2)},
+        args.quiet
+    ))
+
+    results.append({'scenario': 'api', 'calls': client.calls, 'flood_waits': client.flood_waits})
+    # O ru_maxrss nunca diminui: é o pico do processo inteiro, não de um cenário
+    results.append({'scenario': 'process', 'peak_rss_mb': peak_rss_mb()})
+    return results
+
+def print_results(results, previous=None):
+    previous_rows = {row['scenario']: row for row in previous or []}
+    print(f"{'cenário':<15} {'tempo (s)':>10} {'taxa':>26} {'variação':>10}")
+    for row in results:
+        if row['scenario'] == 'api':
+            print(f"{'api':<15} chamadas: {row['calls']} | FloodWait: {row['flood_waits']}")
+            continue
+        if row['scenario'] == 'process':
+            print(f"{'processo':<15} pico RSS (todos os cenários): {row['peak_rss_mb']} MB")
+            continue
+        rates = [(key, value) for key, value in row.items() if key.endswith('_per_second')]
+        rate_text = " | ".join(f"{value} {key.replace('_per_second', '/s')}" for key, value in rates)
+        change = ""
+        old = previous_rows.get(row['scenario'])
+        if old and rates and old.get(rates[0][0]):
+            change = f"{(rates[0][1] / old[rates[0][0]] - 1) * 100:+.1f}%"
+        print(f"{row['scenario']:<15} {row['seconds']:>10} {rate_text:>26} {change:>10}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do downloader contra um cliente falso do Telegram")
+    parser.add_argument('--messages', type=int, default=20000, help="Mensagens no histórico sintético")
+    parser.add_argument('--topics', type=int, default=0, help="Quantidade de tópicos (0 = chat comum)")
+    parser.add_argument('--files', type=int, default=200, help="Quantas mídias baixar no cenário de download")
+    parser.add_argument('--size-scale', type=float, default=0.01, help="Multiplica o tamanho das mídias")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latência por chamada à API (s)")
+    parser.add_argument('--bandwidth', type=float, default=0.0, help="Banda do link em MB/s (0 = ilimitada)")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="Probabilidade de FloodWait por chamada")
+    parser.add_argument('--flood-seconds', type=int, default=1, help="Duração de cada FloodWait (s)")
+    parser.add_argument('--pacing', action='store_true', help="Mantém o ritmo configurado entre páginas")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help="Mostra a saída do downloader")
+    parser.add_argument('--json', help="Grava os resultados neste arquivo")
+    parser.add_argument('--compare', help="Compara com resultados gravados antes com --json")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.json) if args.json else None
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)['results']
+
+    # Os caminhos de config.py são relativos: cache, diário e downloads ficam
+    # num diretório temporário apagado no final
+    original_directory = os.getcwd()
+    work_directory = tempfile.mkdtemp(prefix='tg_benchmark_')
+    os.chdir(work_directory)
+    try:
+        results = run_benchmarks(args)
+    finally:
+        os.chdir(original_directory)
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    print_results(results, previous)
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados gravados em {output_path}")
+
+if __name__ == "__main__":
+    main()
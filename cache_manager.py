@@ -1,47 +1,268 @@
 """Gerenciamento de cache para mensagens"""
 import os
-import json
-import pickle
+import sqlite3
 import time
 import re
-from pyrogram import Client
-from config import SESSION_NAME,MAX_MESSAGES, CACHE_DIRECTORY
-from utils import limpar_nome_arquivo
+import heapq
+import itertools
+from collections import namedtuple
+from pyrogram import enums, raw, types
+from config import CACHE_DIRECTORY
+from utils import limpar_nome_arquivo, connect_read_only, run_coroutine
+from rate_limiter import history_limiter
 
-def get_cache_file_path(chat_id, chat_title):
+# Apenas os campos que o downloader usa; substitui os objetos Message completos no cache
+MediaRecord = namedtuple('MediaRecord', [
+    'id', 'media_kind', 'file_id', 'file_unique_id', 'file_size', 'file_name', 'caption', 'topic_id'
+])
+
+MEDIA_KINDS = ('photo', 'audio', 'video', 'document')
+
+# Filtro da busca do servidor correspondente a cada tipo de mídia
+SEARCH_FILTERS = {
+    'photo': enums.MessagesFilter.PHOTO,
+    'audio': enums.MessagesFilter.AUDIO,
+    'video': enums.MessagesFilter.VIDEO,
+    'document': enums.MessagesFilter.DOCUMENT,
+}
+
+ForumTopicInfo = namedtuple('ForumTopicInfo', ['id', 'title', 'top_message'])
+
+# Fatia do chat de uma execução: IDs inclusivos (0 = sem limite) e datas (datetime ou None).
+# As datas são convertidas em IDs no início da execução (resolve_history_window)
+HistoryWindow = namedtuple('HistoryWindow', ['min_id', 'max_id', 'since', 'until'],
+                           defaults=(0, 0, None, None))
+FULL_HISTORY = HistoryWindow()
+
+def window_bounds_sql(window, column='id'):
+    """Retorna (condição SQL, parâmetros) que restringem column à janela."""
+    conditions, params = [], []
+    if window and window.min_id:
+        conditions.append(f"{column} >= ?")
+        params.append(window.min_id)
+    if window and window.max_id:
+        conditions.append(f"{column} <= ?")
+        params.append(window.max_id)
+    return " AND ".join(conditions) or "1", tuple(params)
+
+# O tópico "General" dos fóruns não tem thread própria: suas mensagens não têm topic_id
+GENERAL_TOPIC_ID = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    media_kind TEXT,
+    file_id TEXT,
+    file_unique_id TEXT,
+    file_size INTEGER,
+    file_name TEXT,
+    caption TEXT,
+    topic_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_topic ON messages (topic_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    topic_id INTEGER PRIMARY KEY,
+    complete INTEGER NOT NULL DEFAULT 0,
+    max_id INTEGER NOT NULL DEFAULT 0,
+    last_updated REAL
+);
+"""
+
+# Um registro vindo de outra busca sem topic_id não apaga o tópico já conhecido
+_UPSERT_MESSAGE = """
+INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    media_kind = excluded.media_kind, file_id = excluded.file_id,
+    file_unique_id = excluded.file_unique_id, file_size = excluded.file_size,
+    file_name = excluded.file_name, caption = excluded.caption,
+    topic_id = COALESCE(excluded.topic_id, messages.topic_id)
+"""
+
+_RECORD_COLUMNS = "id, media_kind, file_id, file_unique_id, file_size, file_name, caption, topic_id"
+
+def message_to_record(message):
+    """Converte uma Message do Pyrogram em MediaRecord (mensagens sem mídia ficam com media_kind None)."""
+    if isinstance(message, MediaRecord):
+        return message
+
+    for kind in MEDIA_KINDS:
+        media = getattr(message, kind, None)
+        if media:
+            break
+    else:
+        kind, media = None, None
+
+    caption = getattr(message, 'caption', None)
+    return MediaRecord(
+        id=message.id,
+        media_kind=kind,
+        file_id=getattr(media, 'file_id', None),
+        file_unique_id=getattr(media, 'file_unique_id', None),
+        file_size=getattr(media, 'file_size', 0) or 0,
+        file_name=getattr(media, 'file_name', None),
+        caption=str(caption) if caption else None,
+        topic_id=get_message_topic_id(message)
+    )
+
+def get_cache_file_path(chat_id, chat_title, create_directory=True):
     """Retorna o caminho do arquivo de cache para um chat."""
-    if not os.path.exists(CACHE_DIRECTORY):
+    if create_directory and not os.path.exists(CACHE_DIRECTORY):
         os.makedirs(CACHE_DIRECTORY)
     
     safe_chat_title = limpar_nome_arquivo(chat_title)
-    return os.path.join(CACHE_DIRECTORY, f"{chat_id}_{safe_chat_title}_cache.pkl")
+    return os.path.join(CACHE_DIRECTORY, f"{chat_id}_{safe_chat_title}_cache.sqlite")
 
-def save_messages_to_cache(chat_id, chat_title, messages):
-    """Salva as mensagens no cache."""
+def open_cache(chat_id, chat_title, read_only=False):
+    """Abre (criando se preciso) o banco SQLite de cache do chat.
+
+    Com read_only o banco precisa existir e é aberto só para leitura, sem
+    criar tabelas nem mudar o modo do diário (usado pelo --plan).
+    """
+    if read_only:
+        return connect_read_only(get_cache_file_path(chat_id, chat_title, create_directory=False))
+    # Os tópicos de um fórum podem gravar no mesmo banco ao mesmo tempo
+    conn = sqlite3.connect(get_cache_file_path(chat_id, chat_title), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def save_messages_to_cache(chat_id, chat_title, messages, verbose=True, track_bounds=True, refresh_low=None):
+    """Salva (ou atualiza) as mensagens no cache.
+
+    Com track_bounds=False as linhas são gravadas sem estender os limites do
+    histórico (history_min_id/history_max_id): é o caso de uma faixa buscada
+    longe do que o cache já cobre, que deixaria um buraco no meio.
+
+    refresh_low é usado pelas atualizações acima do cache, que vêm das mais
+    novas para as mais antigas: as linhas ficam fora dos limites e o trecho já
+    buscado ([refresh_low, mais nova]) fica registrado como pendente até a busca
+    chegar ao cache (finish_pending_refresh); uma atualização interrompida
+    continua dali na próxima execução, sem deixar buraco.
+    """
     try:
-        cache_file = get_cache_file_path(chat_id, chat_title)
-        
-        # Salvar as mensagens completas (serializáveis)
-        cache_data = {
-            'chat_id': chat_id,
-            'chat_title': chat_title,
-            'total_messages': len(messages),
-            'last_updated': time.time(),
-            'messages': messages  # Salvar mensagens completas
-        }
-        
-        with open(cache_file, 'wb') as f:
-            pickle.dump(cache_data, f)
+        records = [message_to_record(msg) for msg in messages]
+
+        conn = open_cache(chat_id, chat_title)
+        try:
+            with conn:
+                meta = dict(conn.execute("SELECT key, value FROM meta"))
+                seeded = False
+                if 'history_max_id' not in meta and 'chat_id' in meta:
+                    # Cache anterior aos limites: todas as linhas vieram do histórico do chat
+                    low, high = conn.execute("SELECT MIN(id), MAX(id) FROM messages").fetchone()
+                    if high is not None:
+                        meta.update(history_min_id=str(low), history_max_id=str(high))
+                        seeded = True
+                conn.executemany(_UPSERT_MESSAGE, records)
+                entries = [('chat_id', str(chat_id)), ('chat_title', chat_title), ('last_updated', str(time.time()))]
+                if refresh_low is not None:
+                    top = max([record.id for record in records] + [int(meta.get('refresh_max_id', 0))])
+                    if top:
+                        entries.extend([('refresh_max_id', str(top)), ('refresh_low_id', str(refresh_low))])
+                    if seeded:
+                        entries.extend([('history_max_id', meta['history_max_id']),
+                                        ('history_min_id', meta['history_min_id'])])
+                elif records and (track_bounds or 'history_max_id' not in meta):
+                    # Limites do histórico do chat; as buscas por tópico gravam no mesmo banco sem mexer neles
+                    ids = [record.id for record in records]
+                    entries.append(('history_max_id', str(max([*ids, int(meta.get('history_max_id', 0))]))))
+                    entries.append(('history_min_id', str(min([*ids, int(meta.get('history_min_id', ids[0]))]))))
+                elif seeded:
+                    entries.extend([('history_max_id', meta['history_max_id']),
+                                    ('history_min_id', meta['history_min_id'])])
+                conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", entries)
+        finally:
+            conn.close()
         
-        print(f"💾 Cache salvo: {len(messages)} mensagens")
+        if verbose:
+            print(f"💾 Cache salvo: {len(records)} mensagens")
         return True
         
     except Exception as e:
         print(f"⚠️  Erro ao salvar cache: {e}")
         return False
 
+def finish_pending_refresh(chat_id, chat_title):
+    """Conclui uma atualização acima do cache: os limites passam a incluir o trecho pendente."""
+    try:
+        conn = open_cache(chat_id, chat_title)
+        try:
+            with conn:
+                meta = dict(conn.execute("SELECT key, value FROM meta"))
+                if 'refresh_max_id' in meta:
+                    high = max(int(meta['refresh_max_id']), int(meta.get('history_max_id', 0)))
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('history_max_id', ?)", (str(high),))
+                    if 'history_min_id' not in meta:
+                        conn.execute("INSERT OR REPLACE INTO meta VALUES ('history_min_id', ?)",
+                                     (meta['refresh_low_id'],))
+                conn.execute("DELETE FROM meta WHERE key IN ('refresh_max_id', 'refresh_low_id')")
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠️  Erro ao salvar cache: {e}")
+
+def mark_cache_complete(chat_id, chat_title):
+    """Marca que o cache já contém o histórico inteiro, até a primeira mensagem."""
+    try:
+        conn = open_cache(chat_id, chat_title)
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠️  Erro ao salvar cache: {e}")
+
+def load_history_bounds(chat_id, chat_title, read_only=False):
+    """Retorna a faixa do histórico coberta pelo cache, sem carregar as mensagens.
+
+    Dicionário com max_id, min_id, complete e pending ((refresh_low, refresh_max)
+    de uma atualização interrompida, ou None), ou None se o histórico do chat
+    ainda não foi buscado.
+    """
+    if not os.path.exists(get_cache_file_path(chat_id, chat_title, create_directory=False)):
+        return None
+    conn = open_cache(chat_id, chat_title, read_only)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if meta.get('chat_id') != str(chat_id):
+            return None
+        if 'history_max_id' in meta:
+            low, high = int(meta['history_min_id']), int(meta['history_max_id'])
+        else:
+            low, high = conn.execute("SELECT MIN(id), MAX(id) FROM messages").fetchone()
+            if high is None:
+                return None
+        return {'max_id': high, 'min_id': low, 'complete': meta.get('complete') == '1',
+                'pending': pending_refresh(meta)}
+    finally:
+        conn.close()
+
+def pending_refresh(meta):
+    """(refresh_low, refresh_max) de uma atualização interrompida, ou None."""
+    if 'refresh_max_id' not in meta:
+        return None
+    return int(meta['refresh_low_id']), int(meta['refresh_max_id'])
+
+def iter_cached_records(chat_id, chat_title, window=None, read_only=False):
+    """Gera os MediaRecords do cache dentro da janela, dos mais novos para os mais antigos."""
+    conn = open_cache(chat_id, chat_title, read_only)
+    try:
+        condition, params = window_bounds_sql(window)
+        for row in conn.execute(
+            f"SELECT {_RECORD_COLUMNS} FROM messages WHERE {condition} ORDER BY id DESC", params
+        ):
+            yield MediaRecord._make(row)
+    finally:
+        conn.close()
+
 def load_messages_from_cache(chat_id, chat_title):
-    """Carrega as mensagens do cache."""
+    """Carrega as mensagens do cache (mais recentes primeiro, como o get_chat_history)."""
     try:
         cache_file = get_cache_file_path(chat_id, chat_title)
         
@@ -49,70 +270,296 @@ def load_messages_from_cache(chat_id, chat_title):
             return None
         
         print(f"📂 Verificando cache: {cache_file}")
-        with open(cache_file, 'rb') as f:
-            cache_data = pickle.load(f)
-        
-        # Verificar se o cache é do mesmo chat
-        if cache_data.get('chat_id') != chat_id:
-            print("⚠️  Cache de chat diferente, ignorando")
+        conn = open_cache(chat_id, chat_title)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+
+            # Só há tópicos no banco: o histórico do chat ainda não foi buscado
+            if 'chat_id' not in meta:
+                return None
+
+            # Verificar se o cache é do mesmo chat
+            if meta.get('chat_id') != str(chat_id):
+                print("⚠️  Cache de chat diferente, ignorando")
+                return None
+
+            # Linhas fora dos limites (faixas separadas, buscas por tópico ou filtradas)
+            # não fazem parte do histórico contínuo e seriam buscadas de novo
+            window = None
+            if 'history_max_id' in meta:
+                window = HistoryWindow(int(meta['history_min_id']), int(meta['history_max_id']))
+            condition, params = window_bounds_sql(window)
+            messages = list(map(MediaRecord._make, conn.execute(
+                f"SELECT {_RECORD_COLUMNS} FROM messages WHERE {condition} ORDER BY id DESC", params
+            )))
+        finally:
+            conn.close()
+
+        if not messages:
             return None
             
-        print(f"💾 Cache encontrado: {cache_data['total_messages']} mensagens")
+        print(f"💾 Cache encontrado: {len(messages)} mensagens")
         
-        return cache_data
+        return {
+            'chat_id': chat_id,
+            'chat_title': meta.get('chat_title', chat_title),
+            'total_messages': len(messages),
+            'max_id': int(meta.get('history_max_id', messages[0].id)),
+            'min_id': int(meta.get('history_min_id', messages[-1].id)),
+            # Uma busca interrompida deixa o cache sem as mensagens mais antigas
+            'complete': meta.get('complete') == '1',
+            # Uma atualização interrompida deixa um trecho já buscado acima de max_id
+            'pending': pending_refresh(meta),
+            'last_updated': float(meta.get('last_updated', 0)),
+            'messages': messages
+        }
         
     except Exception as e:
         print(f"⚠️  Erro ao carregar cache: {e}")
         return None
 
-# No topo do arquivo, garanta que MAX_MESSAGES está importado ou defina um valor
-# from config import MAX_MESSAGES
+def list_cached_chats():
+    """Lista (chat_id, título) dos chats que têm cache, sem acessar a API."""
+    if not os.path.isdir(CACHE_DIRECTORY):
+        return []
+    chats = []
+    for name in sorted(os.listdir(CACHE_DIRECTORY)):
+        if not name.endswith('_cache.sqlite'):
+            continue
+        try:
+            conn = connect_read_only(os.path.join(CACHE_DIRECTORY, name))
+        except sqlite3.Error:
+            continue
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error:
+            continue
+        finally:
+            conn.close()
+        # Só tópicos no banco: o ID e o título vêm do nome do arquivo
+        chat_id, _, title = name[:-len('_cache.sqlite')].partition('_')
+        chats.append((int(meta.get('chat_id', chat_id)), meta.get('chat_title', title)))
+    return chats
+
+def get_replies_page(client, chat_id, topic_id, offset_id=0, limit=100):
+    """Uma página de respostas do tópico com ID menor que offset_id (0 = as mais recentes).
+
+    O get_discussion_replies do Pyrogram só avança por deslocamento dentro de um
+    gerador e não recomeça do meio; o GetReplies aceita offset_id.
+    """
+    result = client.invoke(raw.functions.messages.GetReplies(
+        peer=client.resolve_peer(chat_id), msg_id=topic_id, offset_id=offset_id, offset_date=0,
+        add_offset=0, limit=limit, max_id=0, min_id=0, hash=0
+    ))
+    users = {user.id: user for user in result.users}
+    chats = {chat.id: chat for chat in result.chats}
+    return [
+        run_coroutine(client, types.Message._parse(client, message, users, chats, replies=0))
+        # O cliente falso já entrega mensagens convertidas
+        if isinstance(message, raw.base.Message) else message
+        for message in result.messages
+    ]
+
+def iter_topic_replies(client, chat_id, topic_id):
+    """Gera as respostas do tópico, das mais recentes para as mais antigas.
+
+    Cada página pede as mensagens anteriores à última recebida: um FloodWait ou
+    timeout repete só aquela página, sem buscar de novo as anteriores.
+    """
+    offset_id = 0
+    while True:
+        messages = history_limiter.call(get_replies_page, client, chat_id, topic_id, offset_id)
+        if not messages:
+            return
+        yield from messages
+        offset_id = messages[-1].id
+
+def sync_topic_cache(client, chat_id, chat_title, topic_id, window=None):
+    """Grava no cache as mensagens do tópico que ainda não estão nele.
+
+    As respostas vêm das mais recentes para as mais antigas; depois de uma busca
+    completa, as próximas param ao chegar na última mensagem já conhecida. Com uma
+    janela (HistoryWindow) a busca também para ao passar de window.min_id, e nem
+    começa se o cache já cobre a janela inteira. Retorna quantas mensagens do
+    tópico dentro da janela o cache tem.
+    """
+    window = window or FULL_HISTORY
+    conn = open_cache(chat_id, chat_title)
+    try:
+        state = conn.execute("SELECT complete, max_id FROM topics WHERE topic_id = ?", (topic_id,)).fetchone()
+        # Uma busca interrompida não tem garantia de cobrir o tópico: recomeça do topo
+        known_max = state[1] if state and state[0] else 0
+        # Abaixo deste ID nada é buscado: ou já está no cache ou está fora da janela
+        floor = max(known_max, window.min_id - 1)
+        covered = known_max and window.max_id and window.max_id <= known_max
+        if known_max and not covered:
+            print(f"🔄 Atualizando cache do tópico {topic_id}: buscando mensagens após o ID {floor}...")
+
+        replies = iter_topic_replies(client, chat_id, topic_id) if not covered else iter(())
+
+        batch = []
+        fetched = 0
+        newest = known_max
+        # Parar no início da janela deixa um trecho sem buscar acima do que o cache conhecia
+        complete = not covered
+        for message in replies:
+            if message.id <= floor:
+                complete = message.id <= known_max
+                break
+            newest = max(newest, message.id)
+            batch.append(message_to_record(message)._replace(topic_id=topic_id))
+            if len(batch) >= 500:
+                with conn:
+                    conn.executemany(_UPSERT_MESSAGE, batch)
+                fetched += len(batch)
+                batch = []
+                print(f"   📥 {fetched} mensagens coletadas...")
+
+        with conn:
+            conn.executemany(_UPSERT_MESSAGE, batch)
+            if complete:
+                conn.execute("INSERT OR REPLACE INTO topics VALUES (?, 1, ?, ?)", (topic_id, newest, time.time()))
+        fetched += len(batch)
+
+        if known_max:
+            print(f"➕ {fetched} mensagens novas no tópico" if fetched else "✅ Cache do tópico já está atualizado")
+        condition, params = window_bounds_sql(window)
+        return conn.execute(
+            f"SELECT COUNT(*) FROM messages WHERE topic_id = ? AND {condition}", (topic_id, *params)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+def load_topic_state(chat_id, chat_title, topic_id, read_only=False):
+    """Estado do tópico no cache ({complete, max_id}), ou None se ele nunca foi buscado."""
+    if not os.path.exists(get_cache_file_path(chat_id, chat_title, create_directory=False)):
+        return None
+    conn = open_cache(chat_id, chat_title, read_only)
+    try:
+        row = conn.execute("SELECT complete, max_id FROM topics WHERE topic_id = ?", (topic_id,)).fetchone()
+    except sqlite3.OperationalError:
+        # Cache anterior aos tópicos: a tabela ainda não existe
+        return None
+    finally:
+        conn.close()
+    return {'complete': bool(row[0]), 'max_id': row[1]} if row else None
+
+def iter_cached_topic_records(chat_id, chat_title, topic_id, window=None, read_only=False):
+    """Gera os MediaRecords de um tópico do cache (dentro da janela), em ordem cronológica."""
+    conn = open_cache(chat_id, chat_title, read_only)
+    try:
+        condition, params = window_bounds_sql(window)
+        # O SQLite ordena pelo índice (topic_id, id): nada é carregado inteiro na memória
+        for row in conn.execute(
+            f"SELECT {_RECORD_COLUMNS} FROM messages WHERE topic_id = ? AND {condition} ORDER BY id ASC",
+            (topic_id, *params)
+        ):
+            yield MediaRecord._make(row)
+    finally:
+        conn.close()
+
+def search_media_records(client, chat_id, chat_title, kinds, window=None):
+    """Gera os MediaRecords dos tipos pedidos usando a busca filtrada do servidor.
+
+    Cada tipo é buscado com search_messages e o seu filtro; os resultados (do
+    mais novo para o mais antigo) são intercalados e repetidos são descartados
+    pelo ID. Tudo vai para o cache do chat: depois de uma busca completa de um
+    tipo, as próximas param ao chegar na última mensagem já conhecida dele, e o
+    restante é entregue direto do cache. Com uma janela (HistoryWindow) só as
+    mídias dentro dela são entregues, e cada busca para ao passar do seu início.
+    """
+    window = window or FULL_HISTORY
+    conn = open_cache(chat_id, chat_title)
+    try:
+        known = {key[len('search_max_id_'):]: int(value) for key, value in conn.execute(
+            "SELECT key, value FROM meta WHERE key LIKE 'search_max_id_%'"
+        )}
+        # Tipos cuja busca chegou ao fim -> maior ID encontrado
+        finished = {}
+
+        def search(kind):
+            known_max = known.get(kind, 0)
+            newest = known_max
+            # O limitador refaz a busca do ponto onde parou após FloodWait/timeout
+            for message in history_limiter.iterate(lambda skip: client.search_messages(
+                chat_id, filter=SEARCH_FILTERS[kind], offset=skip
+            )):
+                if message.id <= known_max:
+                    break
+                if message.id < window.min_id:
+                    # O resto está fora da janela; o tipo não fica marcado como sincronizado
+                    return
+                newest = max(newest, message.id)
+                yield message
+            finished[kind] = newest
+
+        seen = set()
+        batch = []
+        merged = heapq.merge(*(search(kind) for kind in kinds), key=lambda msg: msg.id, reverse=True)
+        try:
+            for message in merged:
+                if message.id in seen:
+                    continue
+                seen.add(message.id)
+                record = message_to_record(message)
+                batch.append(record)
+                if len(batch) >= 500:
+                    with conn:
+                        conn.executemany(_UPSERT_MESSAGE, batch)
+                    batch = []
+                    print(f"   📥 {len(seen)} mídias encontradas...")
+                # Acima da janela: fica no cache, mas não é baixado
+                if not window.max_id or record.id <= window.max_id:
+                    yield record
+        except Exception as e:
+            # Os tipos não terminados são buscados do início na próxima execução
+            print(f"⚠️  Busca filtrada interrompida: {e}")
+
+        with conn:
+            conn.executemany(_UPSERT_MESSAGE, batch)
+            conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                             [(f"search_max_id_{kind}", str(max_id)) for kind, max_id in finished.items()])
+        if known:
+            print(f"➕ {len(seen)} mídias novas encontradas" if seen else "✅ Cache da busca já está atualizado")
 
-def get_topic_messages_native(client, chat_id, topic_id):
+        # As mídias já conhecidas saem do cache, continuando do mais novo para o mais antigo
+        placeholders = ', '.join('?' * len(kinds))
+        condition, params = window_bounds_sql(window)
+        for row in conn.execute(
+            f"SELECT {_RECORD_COLUMNS} FROM messages WHERE media_kind IN ({placeholders}) AND {condition} "
+            "ORDER BY id DESC",
+            (*kinds, *params)
+        ):
+            if row[0] not in seen:
+                yield MediaRecord._make(row)
+    finally:
+        conn.close()
+
+def get_topic_messages_native(client, chat_id, topic_id, chat_title, window=None):
     """
-    Busca mensagens de um tópico usando get_discussion_replies.
+    Busca mensagens de um tópico pelas respostas ao tópico (GetReplies), através do cache.
     Esta função é compatível com versões do Pyrogram que não suportam 
     o filtro message_thread_id no search_messages.
+    Retorna um gerador de MediaRecords em ordem cronológica (Aula 1, Aula 2...),
+    só com as mensagens dentro da janela (HistoryWindow), se houver uma.
+    Erros da busca são propagados: uma falha não pode parecer um tópico vazio.
     """
     
-    topic_messages = []
-    
     try:
-        
-        # get_discussion_replies itera sobre as mensagens de um tópico/thread
-        # Ele lida automaticamente com a paginação.
-        # Defina um limite seguro se MAX_MESSAGES não estiver disponível
-        limit = 50000 
-        
-        # Itera sobre o gerador
-        for message in client.get_discussion_replies(chat_id=chat_id, message_id=topic_id, limit=limit):
-            topic_messages.append(message)
-            
-            if len(topic_messages) % 500 == 0:
-                print(f"   📥 {len(topic_messages)} mensagens coletadas...")
-        
-        # O get_discussion_replies geralmente retorna do mais novo para o mais antigo.
-        # Invertemos para manter a ordem cronológica (Aula 1, Aula 2...)
-        topic_messages.reverse()
-        
-        print(f"\n✅ Total de mensagens encontradas: {len(topic_messages)}")
-        
-        if topic_messages:
-            print(f"   📍 Primeira: {topic_messages[0].id} | Última: {topic_messages[-1].id}")
-            
-            # Verificação de segurança: Se retornou 0 mensagens, pode ser um erro de acesso.
-            if len(topic_messages) == 0:
-                print("⚠️  A busca retornou 0 mensagens. O tópico pode estar vazio ou inacessível via API.")
-
-        return topic_messages
-
+        total = sync_topic_cache(client, chat_id, chat_title, topic_id, window)
     except Exception as e:
         print(f"⚠️ Erro na busca por replies: {e}")
-        # Se der erro de atributo, significa que o Pyrogram é MUITO antigo
-        if "object has no attribute 'get_discussion_replies'" in str(e):
-            print("❌ Seu Pyrogram está desatualizado. Execute: pip install -U pyrogram tgcrypto")
+        raise
+
+    print(f"\n✅ Total de mensagens do tópico no cache: {total}")
+
+    if not total:
+        # Verificação de segurança: Se retornou 0 mensagens, pode ser um erro de acesso.
+        print("⚠️  A busca retornou 0 mensagens. O tópico pode estar vazio ou inacessível via API.")
         return []
 
+    return iter_cached_topic_records(chat_id, chat_title, topic_id, window)
+
 
 def get_topic_messages_final_approach(client, channel_id, topic_id):
     """Abordagem final para encontrar mensagens do tópico."""
@@ -166,11 +613,10 @@ def get_topic_messages_by_link_pattern(client, channel_id, topic_id):
         for pattern in search_patterns:
             try:
                 print(f"   🔎 Buscando: {pattern}")
-                found_messages = list(client.search_messages(
-                    chat_id=channel_id,
-                    query=pattern,
-                    limit=100
-                ))
+                found_messages = list(history_limiter.iterate(lambda skip: itertools.islice(
+                    client.search_messages(chat_id=channel_id, query=pattern, offset=skip),
+                    100 - skip
+                )))
                 
                 if found_messages:
                     print(f"   ✅ Encontradas {len(found_messages)} mensagens com padrão: {pattern}")
@@ -194,6 +640,15 @@ def get_topic_messages_by_link_pattern(client, channel_id, topic_id):
         print(f"❌ Erro ao buscar mensagens por padrão de link: {e}")
         return []
 
+def list_forum_topics(client, chat_id):
+    """Lista os tópicos de um fórum como (id, título, id da última mensagem)."""
+    topics = []
+    # O get_forum_topics faz uma única chamada: repeti-la inteira após um FloodWait não refaz nada
+    for topic in history_limiter.call(lambda: list(client.get_forum_topics(chat_id))):
+        title = re.sub(r'\s*\(ID:?\s*\d+\)', '', str(topic.title or f"Tópico {topic.id}"), flags=re.IGNORECASE).strip()
+        topics.append(ForumTopicInfo(topic.id, title, topic.top_message))
+    return topics
+
 def get_message_topic_id(message):
     """Extrai o ID do tópico de uma mensagem com suporte a Fóruns v2."""
     try:
@@ -13,11 +13,95 @@ SESSION_NAME = "user"
 VIDEO_PATH = 'downloads'
 TASK_DIRECTORY = 'chat_download_task'
 CACHE_DIRECTORY = 'cache'
+DEDUP_DATABASE = 'cache/media_index.sqlite'
 UNKNOWN_EXTENSION = 'unknown'
 
-# Sempre baixar todos os tipos de mídia
+# Tipos de mídia baixados quando a execução não escolhe outros (--types)
 DEFAULT_CHOICES = [1, 2, 3, 4]  # Fotos, Áudios, Vídeos, Arquivos
 
+# Com cache existente, busca só as mensagens novas em vez de perguntar se usa o cache
+INCREMENTAL_CACHE_REFRESH = True
+
 # Configurações de download
-MAX_MESSAGES = 50000  # Reduzido para evitar timeouts
-BATCH_SIZE = 100
\ No newline at end of file
+BATCH_SIZE = 100
+# Ritmo da paginação de histórico (segundos entre páginas, ajustado conforme os FloodWait)
+HISTORY_START_INTERVAL = 1.0
+HISTORY_MIN_INTERVAL = 0.3
+HISTORY_MAX_INTERVAL = 10.0
+HISTORY_MAX_RETRIES = 5  # Tentativas após timeout/erro de rede antes de desistir
+
+# Como o histórico é percorrido: 'pages' (get_chat_history, página a página), 'ids'
+# (faixas de IDs buscadas em paralelo com get_messages; indicado para chats enormes) ou
+# 'search' (só as mídias dos tipos escolhidos, pela busca filtrada do servidor; indicado
+# para chats com muito texto). Pode ser trocado por execução com --scan
+HISTORY_SCAN_MODE = 'pages'
+ID_SCAN_BATCH = 200  # IDs por chamada ao get_messages (máximo da API)
+ID_SCAN_CONCURRENCY = 4  # Chamadas simultâneas (o ritmo continua sendo o do limitador)
+
+# Quantos tópicos de um fórum são buscados ao mesmo tempo no modo "todos os tópicos"
+TOPIC_FETCH_CONCURRENCY = 3
+
+# Quantas mensagens já buscadas podem aguardar na fila antes dos downloads
+HISTORY_QUEUE_SIZE = 1000
+
+# Diário de progresso: grava a cada N mensagens ou T segundos (e sempre ao encerrar)
+JOURNAL_BATCH_SIZE = 200
+JOURNAL_FLUSH_INTERVAL = 5.0  # segundos
+
+# Reaproveita (hardlink/cópia) mídias já baixadas em outros chats em vez de baixar de novo
+CROSS_CHAT_DEDUP = True
+
+# Downloads simultâneos
+MAX_CONCURRENT_DOWNLOADS = 4
+
+# Ordem dos downloads: 'chronological' (ordem das mensagens), 'smallest' (menores primeiro),
+# 'largest' (maiores primeiro) ou 'type' (na ordem de DOWNLOAD_TYPE_ORDER)
+DOWNLOAD_ORDER = 'chronological'
+DOWNLOAD_TYPE_ORDER = ['photo', 'audio', 'document', 'video']
+# Com o histórico em streaming a ordenação vale dentro de cada bloco de N mensagens
+DOWNLOAD_ORDER_WINDOW = 1000
+
+# Filas separadas: arquivos a partir de LANE_SPLIT_SIZE usam LARGE_LANE_WORKERS dos
+# MAX_CONCURRENT_DOWNLOADS workers e os menores usam o restante
+SPLIT_LANES = False
+LANE_SPLIT_SIZE = 20 * 1024 * 1024  # 20 MB
+LARGE_LANE_WORKERS = 1
+
+# Arquivos acima deste tamanho são baixados em várias faixas simultâneas
+PARALLEL_DOWNLOAD_THRESHOLD = 50 * 1024 * 1024  # 50 MB
+PARALLEL_DOWNLOAD_PARTS = 4
+
+# Gravação segura: o .part é pré-alocado com o tamanho final (posix_fallocate, onde houver)
+# e vai para o disco (fsync) antes de ser renomeado; os fsync de diretório que tornam as
+# renomeações duráveis são agrupados a cada DIRECTORY_FSYNC_INTERVAL segundos
+PREALLOCATE_FILES = True
+FSYNC_FILES = True
+DIRECTORY_FSYNC_INTERVAL = 5.0
+
+# Limite de banda total dos downloads em bytes/s (None = sem limite); no modo serviço
+# pode ser mudado em execução pela API (POST /bandwidth)
+BANDWIDTH_LIMIT = None
+# Horários com limite próprio: (início, fim, bytes/s ou None); fora deles vale BANDWIDTH_LIMIT
+BANDWIDTH_SCHEDULE = []  # ex: [("08:00", "18:00", 2 * 1024 * 1024)]
+BANDWIDTH_BURST = 2 * 1024 * 1024  # Bytes que podem passar de uma vez sem espera
+# Arquivos até este tamanho passam à frente dos grandes na divisão da banda
+BANDWIDTH_PRIORITY_SIZE = 5 * 1024 * 1024
+
+# Métricas da execução, gravadas em JSON a cada METRICS_INTERVAL segundos (None desativa)
+METRICS_FILE = 'cache/metrics.json'
+METRICS_INTERVAL = 10.0
+# Vazão das últimas execuções (bytes e segundos com downloads ativos), base do ETA do --plan
+THROUGHPUT_HISTORY = 'cache/throughput.json'
+THROUGHPUT_HISTORY_RUNS = 10
+
+# Painel de progresso: redesenhado no máximo a cada PROGRESS_REFRESH_INTERVAL segundos,
+# com a taxa medida nos últimos PROGRESS_RATE_WINDOW segundos
+PROGRESS_REFRESH_INTERVAL = 0.5
+PROGRESS_RATE_WINDOW = 10.0
+
+# Modo serviço (python main.py --service): fila de jobs persistente e API HTTP local
+SERVICE_DATABASE = 'cache/jobs.sqlite'
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+SERVICE_MAX_JOBS = 2  # Jobs rodando ao mesmo tempo (os downloads dividem MAX_CONCURRENT_DOWNLOADS)
+SERVICE_POLL_INTERVAL = 2.0  # segundos entre verificações da fila
\ No newline at end of file
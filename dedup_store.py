@@ -0,0 +1,101 @@
+"""Índice global de mídias já baixadas, por file_unique_id"""
+import os
+import shutil
+import sqlite3
+import threading
+from config import CACHE_DIRECTORY, DEDUP_DATABASE
+from utils import fsync_file, directory_syncer, connect_read_only
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    file_unique_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    file_size INTEGER
+);
+"""
+
+def link_or_copy(source, target):
+    """Cria target como hardlink de source; copia se o sistema de arquivos não permitir.
+
+    O arquivo é criado com nome temporário e renomeado, então target nunca fica pela metade.
+    Retorna o método usado: 'hardlink' ou 'copy'.
+    """
+    directory = os.path.dirname(target)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = f"{target}.link"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    try:
+        os.link(source, temp_path)
+        method = 'hardlink'
+    except OSError:
+        # Outro volume ou sistema de arquivos sem suporte a hardlink
+        shutil.copyfile(source, temp_path)
+        fsync_file(temp_path)
+        method = 'copy'
+
+    os.replace(temp_path, target)
+    directory_syncer.schedule(target)
+    return method
+
+class MediaStore:
+    """Guarda onde cada mídia (file_unique_id) já foi gravada, em qualquer chat.
+
+    Com read_only um índice existente é só consultado: registros de arquivos
+    que sumiram não são esquecidos.
+    """
+
+    def __init__(self, path=DEDUP_DATABASE, read_only=False):
+        self._lock = threading.Lock()
+        self.read_only = read_only
+        if read_only:
+            self._conn = connect_read_only(path)
+            return
+        if not os.path.exists(CACHE_DIRECTORY):
+            os.makedirs(CACHE_DIRECTORY)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def lookup(self, file_unique_id, file_size):
+        """Caminho de uma cópia íntegra da mídia, ou None."""
+        if not file_unique_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM media WHERE file_unique_id = ?", (file_unique_id,)
+            ).fetchone()
+        if not row:
+            return None
+
+        path = row[0]
+        if os.path.exists(path) and os.path.getsize(path) == file_size:
+            return path
+
+        # O arquivo foi apagado ou alterado: esquece o registro
+        if not self.read_only:
+            self.forget(file_unique_id)
+        return None
+
+    def record(self, file_unique_id, path, file_size):
+        if not file_unique_id:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO media VALUES (?, ?, ?)",
+                    (file_unique_id, os.path.abspath(path), file_size)
+                )
+
+    def forget(self, file_unique_id):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM media WHERE file_unique_id = ?", (file_unique_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
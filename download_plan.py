@@ -0,0 +1,170 @@
+"""Plano de download offline: o que falta baixar de um chat, só com o cache e a pasta local"""
+import os
+from config import VIDEO_PATH, DEFAULT_CHOICES, CROSS_CHAT_DEDUP, DEDUP_DATABASE
+from cache_manager import (get_cache_file_path, load_history_bounds, iter_cached_records, load_topic_state,
+                           iter_cached_topic_records, list_cached_chats, HistoryWindow, FULL_HISTORY)
+from progress_journal import ProgressJournal, get_journal_path
+from dedup_store import MediaStore
+from downloader import MEDIA_KIND_CHOICES
+from utils import limpar_nome_arquivo, plan_file_name, DirectoryIndex, FilenamePlanner
+from metrics import load_throughput
+from bandwidth_limiter import bandwidth_limiter, format_rate
+
+PLAN_FIELDS = ('fetch_files', 'fetch_bytes', 'unknown_size', 'present_files', 'present_bytes',
+               'duplicate_files', 'duplicate_bytes', 'collisions')
+
+def select_cached_chat(query=None):
+    """Escolhe um chat com cache pelo ID ou parte do título (pergunta se houver dúvida).
+
+    Retorna (chat_id, título) ou None.
+    """
+    chats = list_cached_chats()
+    if query:
+        folded = query.casefold()
+        chats = [chat for chat in chats if str(chat[0]) == query or folded in chat[1].casefold()]
+    if not chats:
+        print("❌ Nenhum chat com cache encontrado" + (f" para '{query}'" if query else "") + ".")
+        return None
+    if len(chats) == 1:
+        return chats[0]
+
+    print("\n📂 Chats com cache:")
+    for number, (chat_id, title) in enumerate(chats, 1):
+        print(f"   {number}. {title} ({chat_id})")
+    while True:
+        choice = input("\nNúmero do chat: ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(chats):
+            return chats[int(choice) - 1]
+        print("❌ Opção inválida.")
+
+def measured_throughput():
+    """Vazão (bytes/s) das últimas execuções com downloads, ou None se não houver medição."""
+    runs = load_throughput()
+    seconds = sum(run['seconds'] for run in runs)
+    return sum(run['bytes'] for run in runs) / seconds if seconds else None
+
+def build_download_plan(chat_id, chat_title, topic_id=None, choices=None, window=None):
+    """Calcula o que uma execução baixaria, sem acessar a API.
+
+    Percorre as mensagens do cache na mesma ordem da pré-checagem, com os nomes
+    do planejador e os arquivos da pasta, e separa por tipo de mídia o que falta
+    baixar, o que já está na pasta (ou no diário), as repetidas (mesma mídia já
+    baixada neste ou em outro chat, reaproveitadas sem download quando
+    CROSS_CHAT_DEDUP está ativo) e os nomes que colidem e ganham o ID como
+    sufixo. Retorna None se o chat (ou tópico) não tem cache.
+
+    Cache, diário e índice de mídias são abertos só para leitura e, se não
+    existirem, contam como vazios: o plano não cria nem altera nenhum arquivo.
+    """
+    choices = DEFAULT_CHOICES if choices is None else choices
+    window = window or FULL_HISTORY
+    if not os.path.exists(get_cache_file_path(chat_id, chat_title, create_directory=False)):
+        return None
+
+    if topic_id is None:
+        bounds = load_history_bounds(chat_id, chat_title, read_only=True)
+        if not bounds:
+            return None
+        # Só o trecho contínuo do histórico, como numa execução a partir do cache
+        records = iter_cached_records(chat_id, chat_title, HistoryWindow(
+            max(window.min_id, bounds['min_id']),
+            min(window.max_id, bounds['max_id']) if window.max_id else bounds['max_id']
+        ), read_only=True)
+    else:
+        if load_topic_state(chat_id, chat_title, topic_id, read_only=True) is None:
+            return None
+        records = iter_cached_topic_records(chat_id, chat_title, topic_id, window, read_only=True)
+
+    chat_directory = os.path.join(VIDEO_PATH, limpar_nome_arquivo(chat_title))
+    journal = None
+    if os.path.exists(get_journal_path(chat_title, chat_id, create_directory=False)):
+        journal = ProgressJournal(chat_title, chat_id, verbose=False, read_only=True)
+    media_store = MediaStore(read_only=True) if os.path.exists(DEDUP_DATABASE) else None
+    try:
+        planner = FilenamePlanner(chat_directory, journal.file_names() if journal else None)
+        directory_index = DirectoryIndex(chat_directory)
+        kinds = {kind: dict.fromkeys(PLAN_FIELDS, 0)
+                 for kind, choice in MEDIA_KIND_CHOICES.items() if choice in choices}
+        seen_media = set()
+        messages = 0
+
+        for record in records:
+            messages += 1
+            row = kinds.get(record.media_kind)
+            if row is None:
+                continue
+            size = record.file_size or 0
+            path = planner.path_for(record)
+            default_name = plan_file_name(record.caption, record.file_name, record.file_id)
+            if os.path.basename(path) != default_name and not default_name.startswith('.'):
+                row['collisions'] += 1
+
+            if (journal and journal.is_done(record.id)) or directory_index.is_complete(path, size):
+                row['present_files'] += 1
+                row['present_bytes'] += size
+            elif record.file_unique_id and (record.file_unique_id in seen_media or (
+                    media_store and media_store.lookup(record.file_unique_id, size))):
+                row['duplicate_files'] += 1
+                if CROSS_CHAT_DEDUP:
+                    row['duplicate_bytes'] += size
+                else:
+                    # Sem reaproveitamento a cópia repetida também é baixada
+                    row['fetch_files'] += 1
+                    row['fetch_bytes'] += size
+            else:
+                row['fetch_files'] += 1
+                row['fetch_bytes'] += size
+                if not record.file_size:
+                    row['unknown_size'] += 1
+            if record.file_unique_id:
+                seen_media.add(record.file_unique_id)
+    finally:
+        if journal:
+            journal.close()
+        if media_store:
+            media_store.close()
+
+    totals = {field: sum(row[field] for row in kinds.values()) for field in PLAN_FIELDS}
+    measured = measured_throughput()
+    limit = bandwidth_limiter.current_rate()
+    # O limite de banda em vigor vale mesmo se as execuções anteriores foram mais rápidas
+    rate = min(filter(None, (measured, limit)), default=None)
+    return {
+        'chat_id': chat_id,
+        'chat_title': chat_title,
+        'topic_id': topic_id,
+        'messages': messages,
+        'kinds': kinds,
+        'totals': totals,
+        'measured_bytes_per_second': measured,
+        'bandwidth_limit': limit,
+        'eta_seconds': round(totals['fetch_bytes'] / rate) if rate else None,
+    }
+
+def format_mb(size):
+    return f"{size / (1024 * 1024):.1f}"
+
+def format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h {rest // 60:02d}m" if hours else f"{rest // 60}m {rest % 60:02d}s"
+
+def print_download_plan(plan):
+    target = f" (tópico {plan['topic_id']})" if plan['topic_id'] is not None else ""
+    print(f"\n📋 Plano de download: {plan['chat_title']}{target} — {plan['messages']} mensagens no cache")
+    print(f"{'tipo':<10} {'baixar':>8} {'MB':>10} {'presentes':>10} {'MB':>10} "
+          f"{'repetidas':>10} {'MB':>10} {'colisões':>9}")
+    rows = list(plan['kinds'].items()) + [('total', plan['totals'])]
+    for kind, row in rows:
+        print(f"{kind:<10} {row['fetch_files']:>8} {format_mb(row['fetch_bytes']):>10} "
+              f"{row['present_files']:>10} {format_mb(row['present_bytes']):>10} "
+              f"{row['duplicate_files']:>10} {format_mb(row['duplicate_bytes']):>10} {row['collisions']:>9}")
+
+    if plan['totals']['unknown_size']:
+        print(f"⚠️  {plan['totals']['unknown_size']} arquivos sem tamanho conhecido (fora do total de MB)")
+    if plan['measured_bytes_per_second']:
+        print(f"📶 Vazão medida nas últimas execuções: {format_rate(plan['measured_bytes_per_second'])} "
+              f"| Limite de banda: {format_rate(plan['bandwidth_limit'])}")
+    if plan['eta_seconds'] is not None:
+        print(f"⏱️  Tempo estimado: {format_duration(plan['eta_seconds'])}")
+    else:
+        print("⏱️  Tempo estimado: sem medição de vazão (rode um download antes)")
@@ -1,220 +1,806 @@
 """Lógica de download de mídia"""
 import os
 import time
-import json
-from pyrogram import Client
+import itertools
+import threading
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pyrogram import errors
 from tqdm import tqdm
-from config import SESSION_NAME, VIDEO_PATH, DEFAULT_CHOICES, MAX_MESSAGES, BATCH_SIZE
-from utils import (limpar_nome_arquivo, get_cleaned_file_path,
-                  save_last_processed_message_id, load_last_processed_message_id)
-from cache_manager import (save_messages_to_cache, load_messages_from_cache, 
-                          ask_use_cache, get_message_topic_id, 
-                          get_topic_messages_by_link_pattern, get_topic_messages_final_approach,
-                          get_topic_messages_native) 
-
-def download_progress(current, total, bar):
-    """Função de callback para a barra de progresso do tqdm."""
-    bar.update(current - bar.n)
-      
-def get_all_messages_with_topics(client, channel_id, chat_title, use_cache=True):
-    """Obtém todas as mensagens do chat, usando cache se disponível."""
-    
+from config import (VIDEO_PATH, DEFAULT_CHOICES, BATCH_SIZE, HISTORY_QUEUE_SIZE,
+                    MAX_CONCURRENT_DOWNLOADS, PARALLEL_DOWNLOAD_THRESHOLD, PARALLEL_DOWNLOAD_PARTS,
+                    INCREMENTAL_CACHE_REFRESH, CROSS_CHAT_DEDUP, TOPIC_FETCH_CONCURRENCY,
+                    DOWNLOAD_ORDER, DOWNLOAD_TYPE_ORDER, DOWNLOAD_ORDER_WINDOW,
+                    SPLIT_LANES, LANE_SPLIT_SIZE, LARGE_LANE_WORKERS,
+                    HISTORY_SCAN_MODE, ID_SCAN_BATCH, ID_SCAN_CONCURRENCY)
+from utils import (limpar_nome_arquivo, run_in_client_loop, iter_in_background,
+                  DirectoryIndex, FilenamePlanner, directory_syncer)
+from cache_manager import (save_messages_to_cache, load_messages_from_cache, mark_cache_complete,
+                          ask_use_cache, get_topic_messages_by_link_pattern,
+                          get_topic_messages_native, message_to_record, list_forum_topics,
+                          search_media_records, load_history_bounds, iter_cached_records,
+                          finish_pending_refresh,
+                          HistoryWindow, FULL_HISTORY, GENERAL_TOPIC_ID) 
+from media_transfer import download_media_to_file, stream_media_to_file, remove_partial
+from rate_limiter import history_limiter
+from progress_journal import ProgressJournal
+from dedup_store import MediaStore, link_or_copy
+from metrics import metrics
+from progress_display import progress
+
+def stream_history_records(client, channel_id, chat_title, offset_id=0, min_id=0, track_bounds=True):
+    """Pagina o histórico (mais recentes primeiro) gerando MediaRecords conforme chegam.
+
+    Cada página é gravada no cache antes de ser repassada, então uma execução
+    interrompida não perde o que já foi buscado. Não há limite de mensagens.
+    Só as mensagens com ID em (min_id, offset_id) são pedidas à API; com
+    track_bounds=False a faixa não estende os limites do histórico no cache.
+    Com min_id (atualização acima do cache) os limites só sobem quando a busca
+    chega a min_id; até lá o trecho buscado fica pendente no cache.
+    """
+    total = 0
+    refreshing = bool(min_id) and track_bounds
+
+    while True:
+        try:
+            # O limitador espaça as páginas, respeita FloodWait e repete após timeouts
+            messages = history_limiter.call(lambda: list(client.get_chat_history(
+                channel_id, 
+                limit=BATCH_SIZE,
+                offset_id=offset_id,
+                min_id=min_id
+            )))
+        except Exception as e:
+            # O cache continua incompleto (ou com a atualização pendente) e a próxima execução retoma daqui
+            tqdm.write(f"⚠️  Busca de mensagens interrompida: {e}")
+            return
+
+        records = [message_to_record(msg) for msg in messages if msg.id > min_id]
+        if records:
+            save_messages_to_cache(channel_id, chat_title, records, verbose=False, track_bounds=track_bounds,
+                                   refresh_low=messages[-1].id if refreshing else None)
+            total += len(records)
+            if total % (BATCH_SIZE * 10) == 0:
+                tqdm.write(f"   📥 {total} mensagens coletadas...")
+
+        yield from records
+
+        if len(messages) < BATCH_SIZE:
+            break
+
+        offset_id = messages[-1].id
+
+    # Só uma busca completa até a primeira mensagem deixa o cache completo
+    if not min_id and track_bounds:
+        mark_cache_complete(channel_id, chat_title)
+    if refreshing:
+        finish_pending_refresh(channel_id, chat_title)
+    if total:
+        tqdm.write(f"💾 Cache salvo: {total} mensagens")
+
+def scan_history_by_ids(client, channel_id, chat_title, offset_id=0, min_id=0, track_bounds=True):
+    """Percorre o histórico buscando faixas de IDs em paralelo com get_messages.
+
+    O intervalo (min_id, offset_id) é dividido em lotes de ID_SCAN_BATCH IDs,
+    buscados por ID_SCAN_CONCURRENCY threads através do limitador; os resultados
+    são repassados (e gravados no cache) na mesma ordem do get_chat_history, do
+    mais novo para o mais antigo, então uma busca interrompida retoma igual.
+    IDs apagados custam espaço no lote, mas não chamadas extras. Com min_id os
+    limites do cache só sobem no fim, como em stream_history_records.
+    """
+    total = 0
+    refreshing = bool(min_id) and track_bounds
+
+    try:
+        if not offset_id:
+            latest = history_limiter.call(lambda: list(client.get_chat_history(channel_id, limit=1)))
+            offset_id = latest[0].id + 1 if latest else 0
+
+        def fetch(first_id, end_id):
+            messages = history_limiter.call(client.get_messages, channel_id, list(range(first_id, end_id)))
+            found = [msg for msg in messages if msg and not getattr(msg, 'empty', False)]
+            return sorted(found, key=lambda msg: msg.id, reverse=True)
+
+        def deliver(batch, future):
+            nonlocal total
+            records = [message_to_record(msg) for msg in future.result()]
+            # Numa atualização, mesmo um lote vazio avança o trecho pendente
+            if records or refreshing:
+                save_messages_to_cache(channel_id, chat_title, records, verbose=False, track_bounds=track_bounds,
+                                       refresh_low=batch[0] if refreshing else None)
+            if records:
+                previous, total = total, total + len(records)
+                if previous // (BATCH_SIZE * 10) != total // (BATCH_SIZE * 10):
+                    tqdm.write(f"   📥 {total} mensagens coletadas...")
+            return records
+
+        batches = ((max(min_id + 1, end_id - ID_SCAN_BATCH), end_id)
+                   for end_id in range(offset_id, min_id + 1, -ID_SCAN_BATCH))
+
+        with ThreadPoolExecutor(max_workers=ID_SCAN_CONCURRENCY) as pool:
+            pending = deque()
+            try:
+                for batch in batches:
+                    pending.append((batch, pool.submit(fetch, *batch)))
+                    # Poucos lotes adiantados: a memória não cresce com o tamanho do chat
+                    if len(pending) >= ID_SCAN_CONCURRENCY * 2:
+                        yield from deliver(*pending.popleft())
+                while pending:
+                    yield from deliver(*pending.popleft())
+            finally:
+                for _, future in pending:
+                    future.cancel()
+    except Exception as e:
+        # O cache continua incompleto (ou com a atualização pendente) e a próxima execução retoma daqui
+        tqdm.write(f"⚠️  Busca de mensagens interrompida: {e}")
+        return
+
+    if not min_id and track_bounds:
+        mark_cache_complete(channel_id, chat_title)
+    if refreshing:
+        finish_pending_refresh(channel_id, chat_title)
+    if total:
+        tqdm.write(f"💾 Cache salvo: {total} mensagens")
+
+def fetch_history_records(client, channel_id, chat_title, offset_id=0, min_id=0, scan_mode=None,
+                          track_bounds=True):
+    """Percorre o histórico com o modo escolhido (padrão: HISTORY_SCAN_MODE)."""
+    if (scan_mode or HISTORY_SCAN_MODE) == 'ids':
+        return scan_history_by_ids(client, channel_id, chat_title, offset_id, min_id, track_bounds)
+    return stream_history_records(client, channel_id, chat_title, offset_id, min_id, track_bounds)
+
+def resolve_history_window(client, channel_id, window):
+    """Converte as datas da janela em IDs e retorna uma HistoryWindow só com IDs.
+
+    Cada data custa uma chamada (a mensagem mais nova anterior a ela, via
+    offset_date). since é inclusiva e until exclusiva. Retorna None se nenhuma
+    mensagem do chat cabe na janela.
+    """
+    min_id, max_id = window.min_id, window.max_id
+
+    def newest_before(moment):
+        messages = history_limiter.call(lambda: list(client.get_chat_history(
+            channel_id, limit=1, offset_date=moment
+        )))
+        return messages[0].id if messages else 0
+
+    if window.since:
+        # A última mensagem antes de since fica logo abaixo da janela
+        min_id = max(min_id, newest_before(window.since) + 1)
+    if window.until:
+        last_id = newest_before(window.until)
+        if not last_id:
+            return None
+        max_id = min(max_id, last_id) if max_id else last_id
+    if max_id and min_id > max_id:
+        return None
+    return HistoryWindow(min_id, max_id)
+
+def fetch_window_records(client, channel_id, chat_title, window, scan_mode=None):
+    """Gera as mensagens da janela (mais novas primeiro) reaproveitando o trecho que o cache cobre.
+
+    Só as faixas de IDs que faltam no cache são pedidas à API: acima do cache,
+    e abaixo dele se uma busca anterior foi interrompida. Faixas coladas ao
+    cache estendem os seus limites; faixas separadas dele são gravadas sem
+    mexer nos limites, para a atualização incremental não pular o buraco.
+    """
+    low = window.min_id or 1
+    high = window.max_id
+    offset_id = high + 1 if high else 0
+    bounds = load_history_bounds(channel_id, chat_title)
+    if not bounds:
+        return fetch_history_records(client, channel_id, chat_title, offset_id, low - 1, scan_mode)
+
+    cached_low = 1 if bounds['complete'] else bounds['min_id']
+    segments = []
+    if not high or high > bounds['max_id']:
+        # Uma atualização pendente só é retomada pela atualização incremental
+        segments.append(fetch_history_records(client, channel_id, chat_title, offset_id,
+                                              max(bounds['max_id'], low - 1), scan_mode,
+                                              track_bounds=low - 1 <= bounds['max_id'] and not bounds['pending']))
+    cached = HistoryWindow(max(low, cached_low), min(high, bounds['max_id']) if high else bounds['max_id'])
+    if cached.min_id <= cached.max_id:
+        segments.append(iter_cached_records(channel_id, chat_title, cached))
+    if low < cached_low:
+        segments.append(fetch_history_records(client, channel_id, chat_title,
+                                              min(offset_id, cached_low) if high else cached_low,
+                                              low - 1, scan_mode,
+                                              track_bounds=not high or offset_id >= cached_low))
+    return itertools.chain.from_iterable(segments)
+
+def get_all_messages_with_topics(client, channel_id, chat_title, use_cache=True, interactive=True,
+                                 choices=None, scan_mode=None, window=None):
+    """Obtém as mensagens do chat, usando cache se disponível.
+
+    Retorna uma lista quando tudo vem do cache; caso contrário, um gerador que
+    busca o histórico sob demanda enquanto os downloads acontecem.
+    Sem interactive (modo serviço) o cache é sempre atualizado, sem perguntas.
+    No modo 'search' só as mídias dos tipos em choices são buscadas, pela busca
+    filtrada do servidor, sem percorrer as mensagens de texto. Com uma janela
+    (HistoryWindow já resolvida) só a fatia do chat dentro dela é buscada.
+    """
+    scan_mode = scan_mode or HISTORY_SCAN_MODE
+    if scan_mode == 'search':
+        choices = DEFAULT_CHOICES if choices is None else choices
+        kinds = [kind for kind, choice in MEDIA_KIND_CHOICES.items() if choice in choices]
+        print(f"🔍 Buscando mídias no servidor ({', '.join(kinds)})...")
+        return search_media_records(client, channel_id, chat_title, kinds, window)
+
+    if window and window != FULL_HISTORY:
+        print("🔍 Buscando as mensagens da janela escolhida...")
+        return fetch_window_records(client, channel_id, chat_title, window, scan_mode)
+
     if use_cache:
         cache_data = load_messages_from_cache(channel_id, chat_title)
         if cache_data:
+            if INCREMENTAL_CACHE_REFRESH or not interactive:
+                return refresh_cached_messages(client, channel_id, chat_title, cache_data, scan_mode)
             if ask_use_cache(chat_title, cache_data['total_messages']):
                 return cache_data['messages']
         else:
             print("📭 Nenhum cache encontrado, iniciando nova busca...")
     
-    print(f"🔍 Buscando até {MAX_MESSAGES} mensagens do chat...")
-    all_messages = []
+    print("🔍 Buscando mensagens do chat (os downloads começam enquanto a busca continua)...")
+    return fetch_history_records(client, channel_id, chat_title, scan_mode=scan_mode)
+
+def refresh_cached_messages(client, channel_id, chat_title, cache_data, scan_mode=None):
+    """Busca apenas as mensagens mais novas que o cache e as junta a ele.
+
+    Se a atualização anterior foi interrompida, primeiro termina o trecho que
+    faltou entre o cache e o ponto onde ela parou.
+    """
+    cached_messages = cache_data['messages']
+    max_cached_id = cache_data['max_id']
+    new_records = []
+
+    if cache_data.get('pending'):
+        refresh_low, refresh_max = cache_data['pending']
+        print(f"⏯️  Atualização anterior interrompida: continuando antes do ID {refresh_low}...")
+        # As mensagens do trecho pendente já estão no cache, fora dos limites
+        new_records = list(iter_cached_records(channel_id, chat_title, HistoryWindow(refresh_low, refresh_max)))
+        new_records += fetch_history_records(client, channel_id, chat_title, offset_id=refresh_low,
+                                             min_id=max_cached_id, scan_mode=scan_mode)
+        if load_history_bounds(channel_id, chat_title)['pending']:
+            # Interrompida de novo: as mais novas ficam para a próxima execução
+            return new_records + cached_messages
+        max_cached_id = refresh_max
+
+    print(f"🔄 Atualizando cache: buscando mensagens após o ID {max_cached_id}...")
+    # Só as linhas novas são gravadas; o restante do cache fica intacto
+    new_records = list(fetch_history_records(client, channel_id, chat_title, min_id=max_cached_id,
+                                               scan_mode=scan_mode)) + new_records
+
+    if new_records:
+        print(f"➕ {len(new_records)} mensagens novas adicionadas ao cache")
+    else:
+        print("✅ Cache já está atualizado")
+
+    if not cache_data['complete']:
+        # Uma busca anterior foi interrompida: continua a partir da mensagem mais antiga do cache
+        print(f"⏯️  Cache incompleto, continuando a busca antes do ID {cache_data['min_id']}...")
+        return itertools.chain(new_records, cached_messages,
+                               fetch_history_records(client, channel_id, chat_title,
+                                                     offset_id=cache_data['min_id'], scan_mode=scan_mode))
+
+    return new_records + cached_messages
+
+def get_topic_messages_direct(client, channel_id, topic_id, chat_title, window=None):
+    """Busca mensagens específicas do tópico usando abordagem nativa.
+
+    Retorna (mensagens, completa): completa só se a busca nativa do tópico terminou
+    (o padrão de link acha apenas parte das mensagens). Se a busca nativa falhar e
+    o padrão de link não achar nada, o erro é propagado.
+    """
+    fetch_error = None
+    try:
+        topic_records = get_topic_messages_native(client, channel_id, topic_id, chat_title, window)
+        if topic_records:
+            return topic_records, True
+    except Exception as e:
+        fetch_error = e
+    
+    print("❌ Falha na busca nativa. Tentando padrão de link...")
+    link_messages = get_topic_messages_by_link_pattern(client, channel_id, topic_id)
+    if link_messages:
+        window = window or FULL_HISTORY
+        return [message_to_record(msg) for msg in link_messages
+                if msg.id >= window.min_id and (not window.max_id or msg.id <= window.max_id)], fetch_error is None
     
+    if fetch_error:
+        raise fetch_error
+    return [], True
+
+# Tipos de mídia correspondentes a cada opção de DEFAULT_CHOICES (ou --types)
+MEDIA_KIND_CHOICES = {'photo': 1, 'audio': 2, 'video': 3, 'document': 4}
+
+# Vagas de download do processo inteiro: vários jobs do modo serviço dividem o mesmo limite
+download_slots = threading.BoundedSemaphore(MAX_CONCURRENT_DOWNLOADS)
+
+def transfer_media(client, media, file_name, file_size, tracker):
+    """Baixa a mídia para file_name escolhendo o modo de transferência."""
+    if file_size:
+        # Grava em .part com retomada; arquivos grandes usam várias faixas em paralelo
+        parts = PARALLEL_DOWNLOAD_PARTS if file_size >= PARALLEL_DOWNLOAD_THRESHOLD else 1
+        download_media_to_file(
+            client,
+            media,
+            file_name,
+            file_size,
+            parts,
+            progress=tracker
+        )
+    else:
+        # Sem tamanho conhecido não há como dividir nem retomar
+        stream_media_to_file(
+            client,
+            media,
+            file_name,
+            progress=tracker
+        )
+
+def link_worker(source, record, file_name, stats, directory_index):
+    """Reaproveita uma cópia da mesma mídia já baixada em outro chat ou tópico."""
     try:
-        with tqdm(total=MAX_MESSAGES, desc="Coletando mensagens") as pbar:
-            offset_id = 0
-            batch_count = 0
-            
-            while len(all_messages) < MAX_MESSAGES:
+        method = link_or_copy(source, file_name)
+        directory_index.add(file_name, record.file_size)
+        with stats['lock']:
+            stats['linked'] += 1
+        metrics.inc('linked_files')
+        metrics.inc('linked_bytes', record.file_size)
+        # Cópias gastam disco e tempo; hardlinks não: as métricas separam os dois
+        metrics.inc(f'linked_{method}_files')
+        progress.file_done('linked', record, file_name, record.file_size, method=method)
+        return 'linked'
+    except Exception as e:
+        with stats['lock']:
+            stats['errors'] += 1
+        progress.file_done('failed', record, file_name, record.file_size)
+        tqdm.write(f"❌ ERRO ao reaproveitar {os.path.basename(file_name)}: {e}")
+        return None
+
+def download_worker(client, channel_source, record, file_name, stats, directory_index, media_store):
+    """Baixa um único arquivo (executado dentro do pool de downloads).
+
+    O progresso vai para o painel agregado; só os erros são escritos no terminal.
+    """
+    file_size = record.file_size
+    tracker = progress.tracker()
+
+    try:
+        start_time = time.time()
+
+        with download_slots:
+            metrics.add_gauge('active_downloads', 1)
+            progress.transfer_started()
+            try:
+                transfer_media(client, record, file_name, file_size, tracker)
+            except (errors.FileReferenceExpired, errors.FileReferenceInvalid):
+                # O file_id do cache expirou: busca a mensagem de novo e continua
+                fresh_message = client.get_messages(channel_source, record.id)
+                metrics.inc('retries')
+                transfer_media(client, message_to_record(fresh_message), file_name, file_size, tracker)
+            finally:
+                metrics.add_gauge('active_downloads', -1)
+                progress.transfer_finished()
+        size = file_size or os.path.getsize(file_name)
+        directory_index.add(file_name, size)
+        if media_store:
+            media_store.record(record.file_unique_id, file_name, file_size)
+
+        duration = time.time() - start_time
+        metrics.record_download(file_name, size, duration)
+        progress.file_done('downloaded', record, file_name, size, duration, tracker.received)
+        return 'downloaded'
+
+    except Exception as e:
+        with stats['lock']:
+            stats['errors'] += 1
+        metrics.inc('download_errors')
+        progress.file_done('failed', record, file_name, file_size, received=tracker.received)
+        tqdm.write(f"❌ ERRO ao baixar {os.path.basename(file_name)}: {e}")
+        # O .part fica no disco para a próxima tentativa continuar de onde parou;
+        # sem tamanho conhecido não há retomada e o parcial é descartado
+        if not file_size and file_name:
+            remove_partial(file_name)
+        time.sleep(1)
+        return None
+
+# Chave de ordenação de cada política de DOWNLOAD_ORDER (None mantém a ordem das mensagens)
+DOWNLOAD_ORDER_KEYS = {
+    'chronological': None,
+    'smallest': lambda record: record.file_size or 0,
+    'largest': lambda record: -(record.file_size or 0),
+    'type': lambda record: (DOWNLOAD_TYPE_ORDER.index(record.media_kind)
+                            if record.media_kind in DOWNLOAD_TYPE_ORDER else -1),
+}
+
+def order_records(records, policy=DOWNLOAD_ORDER, window=DOWNLOAD_ORDER_WINDOW):
+    """Aplica a política de ordem dos downloads.
+
+    Listas são ordenadas inteiras; geradores (histórico em streaming) são
+    ordenados em blocos de window mensagens para não esperar a busca terminar.
+    """
+    if policy not in DOWNLOAD_ORDER_KEYS:
+        raise ValueError(f"DOWNLOAD_ORDER inválido: {policy} (use {', '.join(DOWNLOAD_ORDER_KEYS)})")
+    key = DOWNLOAD_ORDER_KEYS[policy]
+    if key is None:
+        return records
+    if isinstance(records, list):
+        # sorted é estável: empates continuam na ordem das mensagens
+        return sorted(records, key=key)
+    return _sorted_in_windows(records, key, window)
+
+def _sorted_in_windows(records, key, window):
+    iterator = iter(records)
+    while True:
+        block = list(itertools.islice(iterator, window))
+        if not block:
+            return
+        yield from sorted(block, key=key)
+
+def get_download_location(chat_title, topic_title=None):
+    """Retorna (diretório base, nome da pasta) onde os arquivos do chat ou tópico são gravados."""
+    if topic_title is None:
+        return VIDEO_PATH, chat_title
+    # Tópicos ficam numa subpasta dentro da pasta do chat
+    return os.path.join(VIDEO_PATH, limpar_nome_arquivo(chat_title)), topic_title
+
+def run_download_pool(client, all_messages, chat_title, channel_source, total_to_download=None,
+                      directory_index=None, journal=None, media_store=None, topic_title=None, choices=None,
+                      planner=None, total_bytes=None):
+    """Percorre as mensagens e distribui os downloads num pool limitado de workers.
+
+    all_messages pode ser uma lista ou um gerador de histórico; as mensagens
+    passam por uma fila limitada, então a busca continua enquanto os workers baixam.
+    Mensagens já registradas no diário de progresso são puladas sem tocar no disco.
+    choices são as opções de tipo de mídia da execução (padrão: DEFAULT_CHOICES).
+    total_to_download/total_bytes, quando conhecidos, dão o total do painel desde o início.
+    """
+    with ExitStack() as owned:
+        # O que não foi recebido pronto é criado aqui e fechado ao final
+        if journal is None:
+            journal = ProgressJournal(chat_title, channel_source)
+            owned.callback(journal.close)
+        if media_store is None and CROSS_CHAT_DEDUP:
+            media_store = MediaStore()
+            owned.callback(media_store.close)
+        return _run_download_pool(client, all_messages, chat_title, channel_source, total_to_download,
+                                  directory_index, journal, media_store, topic_title,
+                                  DEFAULT_CHOICES if choices is None else choices, planner, total_bytes)
+
+def _run_download_pool(client, all_messages, chat_title, channel_source, total_to_download,
+                       directory_index, journal, media_store, topic_title, choices, planner, total_bytes):
+    stats = {'messages': 0, 'downloaded': 0, 'linked': 0, 'skipped': 0, 'errors': 0,
+             'lock': threading.Lock()}
+    base_directory, folder_title = get_download_location(chat_title, topic_title)
+    download_directory = os.path.join(base_directory, limpar_nome_arquivo(folder_title))
+    if directory_index is None:
+        directory_index = DirectoryIndex(download_directory)
+    if planner is None:
+        planner = FilenamePlanner(download_directory, journal.file_names(), journal.record_file_name)
+
+    # Com filas separadas, os arquivos grandes têm workers próprios e não bloqueiam os pequenos
+    if SPLIT_LANES:
+        large_workers = max(1, min(LARGE_LANE_WORKERS, MAX_CONCURRENT_DOWNLOADS - 1))
+        lane_workers = {'main': max(1, MAX_CONCURRENT_DOWNLOADS - large_workers), 'large': large_workers}
+    else:
+        lane_workers = {'main': MAX_CONCURRENT_DOWNLOADS}
+
+    def lane_of(record):
+        return 'large' if 'large' in lane_workers and (record.file_size or 0) >= LANE_SPLIT_SIZE else 'main'
+
+    # Limita quantas tarefas ficam enfileiradas além das que estão baixando. A fila dos
+    # grandes aceita mais tarefas em espera para não travar a distribuição dos pequenos
+    in_flight = {'main': threading.BoundedSemaphore(lane_workers['main'] * 2)}
+    if 'large' in lane_workers:
+        in_flight['large'] = threading.BoundedSemaphore(HISTORY_QUEUE_SIZE)
+    pending_by_path = {}
+    pending_by_media = {}
+    pending_lock = threading.Lock()
+
+    def finish(record, file_name):
+        def callback(future):
+            with pending_lock:
+                if pending_by_path.get(file_name) is future:
+                    del pending_by_path[file_name]
+                if pending_by_media.get(record.file_unique_id) is future:
+                    del pending_by_media[record.file_unique_id]
+            # Falhas não entram no diário e são tentadas de novo na próxima execução
+            status = None if future.exception() else future.result()
+            if status:
+                journal.mark(record.id, status, file_name, record.file_size)
+            metrics.add_gauge('download_queue', -1)
+            in_flight[lane_of(record)].release()
+        return callback
+
+    def submit(record, file_name, func, *args):
+        lane = lane_of(record)
+        in_flight[lane].acquire()
+        metrics.add_gauge('download_queue', 1)
+        progress.queued(session, record.file_size)
+        future = executors[lane].submit(func, *args)
+        with pending_lock:
+            pending_by_path[file_name] = future
+            if record.file_unique_id:
+                pending_by_media[record.file_unique_id] = future
+        future.add_done_callback(finish(record, file_name))
+
+    with ExitStack() as lanes:
+        # Por último, as renomeações ainda pendentes de fsync do diretório vão para o disco
+        lanes.callback(directory_syncer.flush)
+        # O painel é fechado depois dos executores, quando o último download termina
+        session = lanes.enter_context(progress.session(total_to_download, total_bytes))
+        executors = {lane: lanes.enter_context(ThreadPoolExecutor(max_workers=workers))
+                     for lane, workers in lane_workers.items()}
+        history_depth = lambda depth: metrics.set_gauge('history_queue', depth)
+        # A ordenação roda na thread da busca, junto com a paginação do histórico
+        for record in iter_in_background(order_records(all_messages), HISTORY_QUEUE_SIZE, history_depth):
+            stats['messages'] += 1
+            metrics.inc('messages')
+
+            # Filtro de tipos antes do diário: mídias de outros tipos não contam como existentes
+            # (e não vão para o diário: outra execução pode escolher outros tipos)
+            if record.media_kind and MEDIA_KIND_CHOICES[record.media_kind] not in choices:
+                continue
+
+            if journal.is_done(record.id):
+                if record.media_kind:
+                    with stats['lock']:
+                        stats['skipped'] += 1
+                    metrics.inc('skipped_files')
+                    metrics.inc('skipped_bytes', record.file_size)
+                continue
+
+            if not record.media_kind:
+                journal.mark(record.id, 'text')
+                continue 
+
+            file_name = planner.path_for(record)
+            file_size = record.file_size
+
+            # Dois downloads nunca escrevem no mesmo caminho (nem baixam a mesma mídia) ao mesmo tempo
+            with pending_lock:
+                previous = [pending_by_path.get(file_name), pending_by_media.get(record.file_unique_id)]
+            for future in previous:
+                if future:
+                    future.result()
+
+            # Verificação de Existência pelo índice do diretório (sem acessar o disco)
+            if directory_index.is_complete(file_name, file_size):
+                # Arquivo existe e tamanho bate -> Pula
+                with stats['lock']:
+                    stats['skipped'] += 1
+                metrics.inc('skipped_files')
+                metrics.inc('skipped_bytes', file_size)
+                journal.mark(record.id, 'existing', file_name, file_size)
+                if media_store:
+                    media_store.record(record.file_unique_id, file_name, file_size)
+                continue
+
+            # A mesma mídia já foi baixada em outro chat/tópico/legenda: reaproveita
+            source = media_store.lookup(record.file_unique_id, file_size) if media_store else None
+            if source and os.path.abspath(source) != os.path.abspath(file_name):
+                submit(record, file_name, link_worker, source, record, file_name, stats, directory_index)
+                continue
+
+            # Se chegou aqui, VAI baixar
+            with stats['lock']:
+                stats['downloaded'] += 1
+
+            submit(record, file_name, download_worker, client, channel_source, record, file_name, stats,
+                   directory_index, media_store)
+
+        progress.discovery_done(session)
+
+    return stats
+
+def fetch_topic_records(client, channel_source, chat_title, topic, interactive=True, choices=None,
+                        scan_mode=None, window=None):
+    """Busca as mensagens de um tópico do fórum.
+
+    Retorna (mensagens, completa); completa indica que a busca chegou até a
+    última mensagem do tópico (topic.top_message) sem falhar.
+    """
+    if topic.id == GENERAL_TOPIC_ID:
+        # O General não tem thread: usa o histórico do chat (com cache) e filtra
+        records = get_all_messages_with_topics(client, channel_source, chat_title, use_cache=True,
+                                               interactive=interactive, choices=choices,
+                                               scan_mode=scan_mode, window=window)
+        records = [record for record in records if record.topic_id in (None, GENERAL_TOPIC_ID)]
+        # Uma busca de histórico interrompida não gera erro, só deixa o cache incompleto
+        # ou aquém da última mensagem (no modo 'search' não há limites: nunca completa)
+        bounds = load_history_bounds(channel_source, chat_title)
+        complete = bool(bounds and bounds['complete'] and bounds['max_id'] >= topic.top_message)
+        return records, complete
+    return get_topic_messages_direct(client, channel_source, topic.id, chat_title, window)
+
+def download_all_topics(client, channel_source, chat_title, choices=None, interactive=True, scan_mode=None,
+                        window=None):
+    """Baixa cada tópico do fórum na sua própria subpasta, com progresso separado.
+
+    As mensagens dos tópicos são buscadas em paralelo e cada tópico é baixado assim
+    que a sua busca termina. Tópicos cuja última mensagem não mudou desde a última
+    execução completa com os mesmos tipos de mídia e modo de busca são pulados
+    sem nenhuma busca. Uma execução com janela não conta como completa.
+    """
+    windowed = window is not None and window != FULL_HISTORY
+    # Uma execução só de fotos não cobre os vídeos do tópico: o marcador é por tipos e modo
+    choices = DEFAULT_CHOICES if choices is None else choices
+    marker = f"top_message:{scan_mode or HISTORY_SCAN_MODE}:{','.join(map(str, sorted(choices)))}"
+    totals = {'messages': 0, 'downloaded': 0, 'linked': 0, 'skipped': 0, 'errors': 0}
+    topics = list_forum_topics(client, channel_source)
+    print(f"🗂️  {len(topics)} tópicos encontrados")
+
+    pending = []
+    for topic in topics:
+        journal = ProgressJournal(chat_title, channel_source, topic_id=topic.id, verbose=False)
+        try:
+            synced = journal.get_meta(marker) == str(topic.top_message)
+        finally:
+            journal.close()
+        if synced:
+            print(f"   ✅ Sem novidades: {topic.title}")
+            continue
+        pending.append(topic)
+
+    with ExitStack() as owned:
+        media_store = MediaStore() if CROSS_CHAT_DEDUP else None
+        if media_store:
+            owned.callback(media_store.close)
+
+        with ThreadPoolExecutor(max_workers=TOPIC_FETCH_CONCURRENCY) as fetch_pool:
+            futures = {
+                fetch_pool.submit(fetch_topic_records, client, channel_source, chat_title, topic,
+                                  interactive, choices, scan_mode, window): topic
+                for topic in pending
+            }
+            for future in as_completed(futures):
+                topic = futures[future]
                 try:
-                    batch_count += 1
-                    messages = list(client.get_chat_history(
-                        channel_id, 
-                        limit=BATCH_SIZE,
-                        offset_id=offset_id
-                    ))
-                    
-                    if not messages:
-                        break
-                        
-                    all_messages.extend(messages)
-                    pbar.update(len(messages))
-                    
-                    if len(messages) < BATCH_SIZE:
-                        break
-                        
-                    offset_id = messages[-1].id
-                    time.sleep(1)
-                    
+                    records, complete = future.result()
                 except Exception as e:
-                    if "PEER_ID_INVALID" in str(e) or "timeout" in str(e).lower():
-                        break
-                    time.sleep(5)
+                    totals['errors'] += 1
+                    print(f"❌ Erro ao buscar o tópico {topic.title}: {e}")
                     continue
-        
-        if all_messages:
-            save_messages_to_cache(channel_id, chat_title, all_messages)
-        
-        return all_messages
-        
+
+                # O diário só fica aberto enquanto o tópico é baixado: fóruns com centenas
+                # de tópicos não mantêm uma conexão (e os arquivos WAL) para cada um
+                journal = ProgressJournal(chat_title, channel_source, topic_id=topic.id, verbose=False)
+                try:
+                    print(f"\n📂 Tópico: {topic.title}")
+                    stats = run_download_pool(client, records, chat_title, channel_source,
+                                              journal=journal, media_store=media_store,
+                                              topic_title=topic.title, choices=choices)
+                    for key in totals:
+                        totals[key] += stats[key]
+                    # Só marca o tópico como sincronizado se a busca foi completa e nada falhou
+                    if complete and not stats['errors'] and not windowed:
+                        journal.set_meta(marker, topic.top_message)
+                except Exception as e:
+                    totals['errors'] += 1
+                    print(f"❌ Erro no tópico {topic.title}: {e}")
+                finally:
+                    journal.close()
+
+    return totals
+
+def download_media_from_channel(client, channel_source, chat_title, topic_id, choices=None, scan_mode=None,
+                                window=None):
+    """Lógica principal de download (usa o cliente já conectado da execução)."""
+    try:
+        return sync_channel(client, channel_source, chat_title, topic_id, choices, scan_mode=scan_mode,
+                            window=window)
     except Exception as e:
-        print(f"❌ Erro ao buscar mensagens: {e}")
-        return []
-
-def get_topic_messages_direct(client, channel_id, topic_id, chat_title):
-    """Busca mensagens específicas do tópico usando abordagem nativa."""
-    topic_messages = get_topic_messages_native(client, channel_id, topic_id)
-    if topic_messages:
-        return topic_messages
+        print(f"❌ ERRO CRÍTICO: {e}")
+
+def count_existing_files(records, journal, directory_index, planner, choices=None):
+    """Retorna (mídias encontradas, mídias já baixadas, bytes restantes) sem acessar o disco arquivo por arquivo.
+
+    Só contam as mídias dos tipos em choices (padrão: DEFAULT_CHOICES).
+    """
+    choices = DEFAULT_CHOICES if choices is None else choices
+    # Filtra apenas mensagens com mídia para cálculos
+    media_messages = [record for record in records
+                      if record.media_kind and MEDIA_KIND_CHOICES[record.media_kind] in choices]
     
-    print("❌ Falha na busca nativa. Tentando padrão de link...")
-    link_messages = get_topic_messages_by_link_pattern(client, channel_id, topic_id)
-    if link_messages:
-        return link_messages
+    print(f"📊 Analisando {len(media_messages)} arquivos encontrados...")
+
+    existing_files_count = 0
+    remaining_bytes = 0
     
-    return []
+    # Vamos iterar rapidinho só para checar existência
+    for record in media_messages:
+        # O planejador reserva o nome que o loop principal vai usar
+        check_path = planner.path_for(record)
+        # Verifica tamanho para garantir que não está corrompido/incompleto
+        if journal.is_done(record.id) or directory_index.is_complete(check_path, record.file_size):
+            existing_files_count += 1
+        else:
+            remaining_bytes += record.file_size or 0
+
+    return len(media_messages), existing_files_count, remaining_bytes
+
+def sync_channel(client, channel_source, chat_title, topic_id, choices=None, interactive=True, scan_mode=None,
+                 window=None):
+    """Baixa as mídias de um chat, tópico ou fórum inteiro e retorna as estatísticas.
+
+    choices são os tipos de mídia da execução (padrão: DEFAULT_CHOICES),
+    scan_mode o modo de busca do histórico (padrão: HISTORY_SCAN_MODE) e window
+    uma HistoryWindow que limita a execução a uma fatia do chat.
+    Erros são propagados para quem chamou; retorna None se não houver mensagens.
+    """
+    chat_directory = os.path.join(VIDEO_PATH, limpar_nome_arquivo(chat_title))
+    if not os.path.exists(chat_directory):
+        os.makedirs(chat_directory)
+
+    if window and window != FULL_HISTORY:
+        window = resolve_history_window(client, channel_source, window)
+        if window is None:
+            print("❌ Nenhuma mensagem dentro do período escolhido.")
+            return None
+        print(f"🗓️  Janela: IDs {window.min_id or 'início'} até {window.max_id or 'a mais recente'}")
+
+    # Fórum inteiro: cada tópico vai para a sua subpasta
+    if topic_id == "ALL_TOPICS":
+        print(f"   ⚡ Downloads simultâneos: {MAX_CONCURRENT_DOWNLOADS}")
+        stats = run_in_client_loop(client, download_all_topics, client, channel_source, chat_title,
+                                   choices, interactive, scan_mode, window)
+        print("=" * 60)
+        print(f"🎉 Concluído! Baixados: {stats['downloaded']} | Reaproveitados: {stats['linked']} | "
+              f"Existentes: {stats['skipped']} | Erros: {stats['errors']}")
+        return stats
+
+    # Uma única leitura do diretório serve para a pré-checagem e para o loop principal
+    directory_index = DirectoryIndex(chat_directory)
+    journal = ProgressJournal(chat_title, channel_source)
+    planner = FilenamePlanner(chat_directory, journal.file_names(), journal.record_file_name)
 
-def download_media_from_channel(channel_source, chat_title, topic_id):
-    """Lógica principal de download."""
     try:
-        with Client(SESSION_NAME) as client:
-            chat_directory = os.path.join(VIDEO_PATH, limpar_nome_arquivo(chat_title))
-            if not os.path.exists(chat_directory):
-                os.makedirs(chat_directory)
+        # --- COLETA DE MENSAGENS ---
+        if topic_id and topic_id != -1:
+            all_messages, _ = get_topic_messages_direct(client, channel_source, int(topic_id), chat_title,
+                                                        window)
+        else:
+            all_messages = get_all_messages_with_topics(client, channel_source, chat_title, use_cache=True,
+                                                        interactive=interactive, choices=choices,
+                                                        scan_mode=scan_mode, window=window)
+        
+        real_total_to_download = None
+        remaining_bytes = None
 
-            last_id = 0
-            
-            # --- COLETA DE MENSAGENS ---
-            if topic_id and topic_id != "ALL_TOPICS" and topic_id != -1:
-                all_messages = get_topic_messages_direct(client, channel_source, int(topic_id), chat_title)
-            else:
-                all_messages = get_all_messages_with_topics(client, channel_source, chat_title, use_cache=True)
-            
+        if isinstance(all_messages, list):
             if not all_messages:
                 print("❌ Nenhuma mensagem encontrada.")
-                return
-            
-            # Filtra apenas mensagens com mídia para cálculos
-            media_messages = [msg for msg in all_messages if msg.photo or msg.audio or msg.video or msg.document]
+                return None
             
-            print(f"📊 Analisando {len(media_messages)} arquivos encontrados...")
-
             # --- NOVO: PRÉ-CHECAGEM DE ARQUIVOS ---
             # Verifica quantos já existem para mostrar o total correto (Total Encontrado - Já Baixados)
-            existing_files_count = 0
-            
-            # Vamos iterar rapidinho só para checar existência
-            for msg in media_messages:
-                media = msg.photo or msg.audio or msg.video or msg.document
-                # Usamos a função auxiliar para prever o nome
-                check_path = get_cleaned_file_path(media, VIDEO_PATH, chat_title, msg.caption)
-                if os.path.exists(check_path):
-                    # Verifica tamanho para garantir que não está corrompido/incompleto
-                    file_size = getattr(media, 'file_size', 0) or 0
-                    if os.path.getsize(check_path) == file_size:
-                        existing_files_count += 1
-            
-            real_total_to_download = len(media_messages) - existing_files_count
+            media_count, existing_files_count, remaining_bytes = count_existing_files(
+                all_messages, journal, directory_index, planner, choices
+            )
+            real_total_to_download = media_count - existing_files_count
             print(f"   📂 Já existem: {existing_files_count}")
-            print(f"   📥 Restam baixar: {real_total_to_download}")
-            print("=" * 60)
-            print("             Iniciando Download" )
+            print(f"   📥 Restam baixar: {real_total_to_download} ({remaining_bytes / (1024 * 1024):.2f} MB)")
 
-            downloaded_count = 0
-            skipped_count = 0 # Mantemos para log final
-            error_count = 0
-            
-            # --- LOOP PRINCIPAL ---
-            for message in all_messages:
-                
-                # Ignorar mensagens antigas se houver lógica de last_id
-                if message.id <= last_id:
-                    continue
-                
-                media = message.photo or message.audio or message.video or message.document
-                
-                if not media:
-                    save_last_processed_message_id(chat_title, channel_source, message.id)
-                    continue 
-
-                # Filtro de tipos
-                is_valid_type = (
-                    (1 in DEFAULT_CHOICES and message.photo) or
-                    (2 in DEFAULT_CHOICES and message.audio) or
-                    (3 in DEFAULT_CHOICES and message.video) or
-                    (4 in DEFAULT_CHOICES and message.document)
-                )
-
-                if is_valid_type:
-                    file_name = get_cleaned_file_path(media, VIDEO_PATH, chat_title, message.caption)
-                    file_size = getattr(media, 'file_size', 0) or 0
-                    
-                    # Verificação de Existência (De novo, para decidir se baixa)
-                    if os.path.exists(file_name):
-                        if os.path.getsize(file_name) == file_size:
-                            # Arquivo existe e tamanho bate -> Pula
-                            skipped_count += 1
-                            save_last_processed_message_id(chat_title, channel_source, message.id)
-                            continue
-                    
-                    # Se chegou aqui, VAI baixar
-                    downloaded_count += 1
-                    
-                    # Info visual
-                    message_info = message.caption or message.text or getattr(media, 'file_name', f"Arquivo {message.id}")
-                    clean_info = message_info.replace('\n', ' ').strip()
-                    
-                    print(f"\n📥 Baixando: [{downloaded_count}/{real_total_to_download}] | {clean_info} [{file_size / (1024*1024):.2f} MB]")
-                    
-                    bar = tqdm(
-                        total=file_size, 
-                        desc="   🚀", 
-                        leave=False, 
-                        unit='B', 
-                        unit_scale=True,
-                        ncols=120,
-                        bar_format='{desc} {percentage:3.0f}%|{bar:40}| {rate_fmt} | Decorrido: {elapsed} | Restante: {remaining}',
-                        colour="#276827"
-                    )
-                    
-                    try:
-                        start_time = time.time()
-                        
-                        client.download_media(
-                            media, 
-                            file_name=file_name, 
-                            progress=lambda current, total: download_progress(current, total, bar)
-                        )
-                        bar.close()
-                        
-                        duration = time.time() - start_time
-                        time_str = f"{duration:.1f}s" if duration < 60 else f"{int(duration)//60}m {int(duration)%60}s"
-                        
-                        print(f"   ✅ Download com Sucesso {os.path.basename(file_name)} em {time_str}")
-                        
-                    except Exception as e:
-                        bar.close()
-                        error_count += 1
-                        print(f"\n❌ ERRO: {e}")
-                        if file_name and os.path.exists(file_name):
-                             try: os.remove(file_name)
-                             except: pass
-                        time.sleep(1)
-
-                save_last_processed_message_id(chat_title, channel_source, message.id)
-                
-            print("=" * 60)
-            print(f"🎉 Concluído! Baixados: {downloaded_count} | Existentes: {skipped_count} | Erros: {error_count}")
-            
-    except Exception as e:
-        print(f"❌ ERRO CRÍTICO: {e}")
\ No newline at end of file
+        print(f"   ⚡ Downloads simultâneos: {MAX_CONCURRENT_DOWNLOADS}")
+        print("=" * 60)
+        print("             Iniciando Download" )
+
+        # --- LOOP PRINCIPAL ---
+        # O pool roda numa thread auxiliar enquanto o loop do cliente atende os workers
+        stats = run_in_client_loop(client, run_download_pool, client, all_messages, chat_title,
+                                   channel_source, real_total_to_download, directory_index, journal,
+                                   None, None, choices, planner, remaining_bytes)
+    finally:
+        # Grava o último lote do diário mesmo se a execução for interrompida
+        journal.close()
+
+    if not stats['messages']:
+        print("❌ Nenhuma mensagem encontrada.")
+        return None
+        
+    print("=" * 60)
+    print(f"🎉 Concluído! Baixados: {stats['downloaded']} | Reaproveitados: {stats['linked']} | "
+          f"Existentes: {stats['skipped']} | Erros: {stats['errors']}")
+    return stats
@@ -0,0 +1,209 @@
+"""Cliente falso do Telegram para medir desempenho sem acessar a API"""
+import time
+import zlib
+import random
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from pyrogram import errors
+
+# Tamanho médio (bytes) de cada tipo de mídia no histórico sintético
+MEDIA_SIZES = {
+    'photo': 250 * 1024,
+    'audio': 5 * 1024 * 1024,
+    'video': 60 * 1024 * 1024,
+    'document': 3 * 1024 * 1024,
+}
+
+# Peso de cada tipo de mídia no histórico sintético (o resto são mensagens de texto)
+MEDIA_WEIGHTS = {'photo': 0.45, 'audio': 0.1, 'video': 0.25, 'document': 0.2}
+
+EXTENSIONS = {'photo': None, 'audio': 'mp3', 'video': 'mp4', 'document': 'pdf'}
+
+# Pedaços entregues pelo stream_media, como no Pyrogram
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Bytes aleatórios fixos de onde sai o conteúdo das mídias (duas cópias seguidas,
+# para qualquer fatia de um chunk caber sem dar a volta)
+_NOISE = random.Random(0).randbytes(2 * STREAM_CHUNK_SIZE + 1)
+_NOISE_TWICE = _NOISE * 2
+
+# Data da mensagem de ID 1; as seguintes vêm a cada MESSAGE_INTERVAL
+HISTORY_START = datetime(2024, 1, 1)
+MESSAGE_INTERVAL = timedelta(minutes=10)
+
+def generate_history(count, topics=0, media_ratio=0.8, size_scale=1.0, seed=0):
+    """Gera count mensagens sintéticas (ID 1 é a mais antiga) com mídias e tópicos.
+
+    Com topics > 0 as mensagens são distribuídas entre os tópicos 2..topics+1,
+    como num fórum; size_scale multiplica o tamanho das mídias. As datas começam
+    em HISTORY_START e avançam MESSAGE_INTERVAL por mensagem.
+    """
+    rng = random.Random(seed)
+    kinds = list(MEDIA_WEIGHTS)
+    weights = list(MEDIA_WEIGHTS.values())
+    topic_ids = [topic + 2 for topic in range(topics)]
+
+    messages = []
+    for message_id in range(1, count + 1):
+        message = SimpleNamespace(id=message_id, photo=None, audio=None, video=None, document=None,
+                                  caption=None, text=None, message_thread_id=None,
+                                  date=HISTORY_START + MESSAGE_INTERVAL * (message_id - 1))
+        if topic_ids:
+            message.message_thread_id = rng.choice(topic_ids)
+
+        if rng.random() < media_ratio:
+            kind = rng.choices(kinds, weights)[0]
+            size = max(1, int(MEDIA_SIZES[kind] * size_scale * rng.uniform(0.5, 1.5)))
+            extension = EXTENSIONS[kind]
+            setattr(message, kind, SimpleNamespace(
+                file_id=f"fake_{message_id}",
+                file_unique_id=f"uniq_{message_id}",
+                file_size=size,
+                file_name=f"{kind}_{message_id}.{extension}" if extension else None,
+            ))
+            if rng.random() < 0.3:
+                message.caption = f"Aula {message_id} - {kind}"
+        else:
+            message.text = f"Mensagem {message_id}"
+        messages.append(message)
+    return messages
+
+def media_chunk(media, index):
+    """Conteúdo do chunk index da mídia, como o stream_media entrega.
+
+    Depende da mídia e da posição, então uma faixa gravada no deslocamento
+    errado não passa despercebida; é uma fatia de _NOISE, barata de gerar.
+    """
+    size = min(STREAM_CHUNK_SIZE, media.file_size - index * STREAM_CHUNK_SIZE)
+    seed = zlib.crc32(str(getattr(media, 'file_unique_id', '')).encode())
+    start = (seed + index * 7919) % len(_NOISE)
+    return _NOISE_TWICE[start:start + size]
+
+def media_content(media):
+    """Conteúdo completo da mídia (para conferir um download byte a byte)."""
+    chunks = -(-media.file_size // STREAM_CHUNK_SIZE)
+    return b"".join(media_chunk(media, index) for index in range(chunks))
+
+class FakeTelegramClient:
+    """Imita os métodos síncronos do Pyrogram usados pelo downloader.
+
+    latency: segundos de espera em cada chamada à API (por página).
+    bandwidth: bytes/s do link, dividido entre todos os downloads (None = ilimitado).
+    flood_wait_rate: probabilidade de uma chamada responder com FloodWait de
+    flood_wait_seconds segundos.
+    """
+
+    def __init__(self, messages, chat_id=-1001, title="Benchmark", latency=0.0, bandwidth=None,
+                 flood_wait_rate=0.0, flood_wait_seconds=1, seed=0):
+        self.messages = messages
+        self.chat_id = chat_id
+        self.title = title
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.calls = 0
+        self.flood_waits = 0
+        self._by_id = {message.id: message for message in messages}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._link_free_at = 0.0
+
+    def _api_call(self):
+        """Conta a chamada, aplica a latência e às vezes responde com FloodWait."""
+        with self._lock:
+            self.calls += 1
+            flood = self._rng.random() < self.flood_wait_rate
+            if flood:
+                self.flood_waits += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if flood:
+            raise errors.FloodWait(value=self.flood_wait_seconds)
+
+    def _transfer(self, size):
+        """Ocupa o link pelo tempo que size bytes levam na banda configurada."""
+        if not self.bandwidth:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._link_free_at = max(now, self._link_free_at) + size / self.bandwidth
+            delay = self._link_free_at - now
+        time.sleep(delay)
+
+    def _newest_first(self, messages, limit, offset=0):
+        ordered = sorted(messages, key=lambda message: message.id, reverse=True)[offset:]
+        return ordered[:limit] if limit else ordered
+
+    def get_chat(self, chat_id):
+        self._api_call()
+        return SimpleNamespace(id=self.chat_id, title=self.title, is_forum=False)
+
+    def get_chat_history(self, chat_id, limit=0, offset_id=0, offset_date=None, min_id=0, max_id=0):
+        self._api_call()
+        selected = [message for message in self.messages
+                    if (not offset_id or message.id < offset_id) and message.id > min_id
+                    and (not max_id or message.id < max_id)
+                    and (not offset_date or message.date < offset_date)]
+        yield from self._newest_first(selected, limit)
+
+    def resolve_peer(self, chat_id):
+        return chat_id
+
+    def invoke(self, query):
+        """Só o GetReplies (respostas de um tópico), com as mensagens já convertidas."""
+        self._api_call()
+        replies = [message for message in self.messages
+                   if message.message_thread_id == query.msg_id
+                   and (not query.offset_id or message.id < query.offset_id)]
+        return SimpleNamespace(messages=self._newest_first(replies, query.limit), users=[], chats=[])
+
+    def get_forum_topics(self, chat_id):
+        self._api_call()
+        topic_ids = sorted({message.message_thread_id for message in self.messages if message.message_thread_id})
+        for topic_id in topic_ids:
+            top_message = max(message.id for message in self.messages if message.message_thread_id == topic_id)
+            yield SimpleNamespace(id=topic_id, title=f"Tópico {topic_id}", top_message=top_message)
+
+    def get_messages(self, chat_id, message_ids):
+        self._api_call()
+        if isinstance(message_ids, (list, tuple, set, range)):
+            return [self._by_id.get(message_id, SimpleNamespace(id=message_id, empty=True))
+                    for message_id in message_ids]
+        return self._by_id.get(message_ids, SimpleNamespace(id=message_ids, empty=True))
+
+    def search_messages(self, chat_id, query="", offset=0, limit=0, filter=None):
+        # Com filter (MessagesFilter.PHOTO, VIDEO...) só entram as mídias daquele tipo
+        kind = filter.name.lower() if filter is not None else None
+        found = self._newest_first(
+            [message for message in self.messages
+             if (not query or query in (message.caption or message.text or ""))
+             and (query or kind) and (not kind or getattr(message, kind, None))],
+            limit, offset
+        )
+        # Página de 100 como no Pyrogram: a latência se repete a cada página
+        for index, message in enumerate(found):
+            if index % 100 == 0:
+                self._api_call()
+            yield message
+
+    def stream_media(self, media, offset=0, limit=0):
+        self._api_call()
+        file_size = media.file_size
+        chunk = offset
+        while (not limit or chunk < offset + limit) and chunk * STREAM_CHUNK_SIZE < file_size:
+            size = min(STREAM_CHUNK_SIZE, file_size - chunk * STREAM_CHUNK_SIZE)
+            self._transfer(size)
+            yield media_chunk(media, chunk)
+            chunk += 1
+
+    def download_media(self, media, file_name=None, progress=None):
+        written = 0
+        with open(file_name, 'wb') as f:
+            for chunk in self.stream_media(media):
+                f.write(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written, media.file_size)
+        return file_name
@@ -10,47 +10,150 @@
 from session_manager import authenticate, force_clean_sessions
 from utils import show_banner, cache_path, rename_files
 from chat_selector import get_channel, select_topic_from_chat
-from downloader import download_media_from_channel
+from downloader import download_media_from_channel, MEDIA_KIND_CHOICES
+from cache_manager import HistoryWindow
+from service import run_service, parse_choices
+from metrics import MetricsFileWriter
+from progress_display import progress
+from download_plan import select_cached_chat, build_download_plan, print_download_plan
 from config import VIDEO_PATH
 import sys
-import time
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+
+def parse_types(value):
+    """Converte --types ("photo,video" ou "1,3") nas opções de tipo de mídia."""
+    names = [name.strip().lower() for name in value.split(',') if name.strip()]
+    try:
+        return parse_choices([MEDIA_KIND_CHOICES.get(name, name) for name in names])
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"tipos inválidos: {value} (use {', '.join(MEDIA_KIND_CHOICES)} ou 1-4)"
+        )
+
+def parse_date(value):
+    """Converte uma data AAAA-MM-DD da linha de comando."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida: {value} (use AAAA-MM-DD)")
+
+def history_window(args):
+    """Monta a janela da execução; --until inclui o dia inteiro."""
+    return HistoryWindow(
+        min_id=args.min_id or 0,
+        max_id=args.max_id or 0,
+        since=args.since,
+        until=args.until + timedelta(days=1) if args.until else None,
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Baixa as mídias de chats e tópicos do Telegram")
+    parser.add_argument('--clean-sessions', action='store_true', help="Limpa todas as sessões forçadamente")
+    parser.add_argument('--service', action='store_true',
+                        help="Roda sem menus, recebendo jobs pela API HTTP local")
+    parser.add_argument('--types', type=parse_types, default=None,
+                        help="Tipos de mídia a baixar, ex.: photo,video ou 1,3 (padrão: DEFAULT_CHOICES)")
+    parser.add_argument('--scan', choices=['pages', 'ids', 'search'], default=None,
+                        help="Como buscar o histórico (padrão: HISTORY_SCAN_MODE); 'search' busca só as "
+                             "mídias dos tipos escolhidos no servidor")
+    parser.add_argument('--since', type=parse_date, help="Só mensagens a partir desta data (AAAA-MM-DD)")
+    parser.add_argument('--until', type=parse_date, help="Só mensagens até esta data, inclusive (AAAA-MM-DD)")
+    parser.add_argument('--min-id', type=int, help="Só mensagens com ID a partir deste")
+    parser.add_argument('--max-id', type=int, help="Só mensagens com ID até este")
+    parser.add_argument('--plan', nargs='?', const='', metavar='CHAT',
+                        help="Sem acessar a API: mostra o que falta baixar de um chat com cache (ID ou parte "
+                             "do título), com bytes por tipo, repetidas, colisões de nome e tempo estimado")
+    parser.add_argument('--topic', type=int, help="Com --plan: planeja só este tópico")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Sem painel: escreve na saída padrão uma linha JSON por arquivo concluído "
+                             "(as mensagens vão para a saída de erro)")
+    return parser.parse_args(argv)
+
+def show_plan(args):
+    """Modo --plan: só cache, diário e pasta local; nenhuma chamada à API."""
+    if args.since or args.until:
+        print("❌ --since/--until precisam da API para virar IDs; no --plan use --min-id/--max-id.")
+        return
+    chat = select_cached_chat(args.plan)
+    if not chat:
+        return
+    plan = build_download_plan(*chat, topic_id=args.topic, choices=args.types, window=history_window(args))
+    if not plan:
+        print("❌ O cache deste chat ainda não tem o histórico" + (" do tópico." if args.topic else "."))
+        return
+    if progress.json_lines:
+        progress.emit({'event': 'plan', **plan})
+    else:
+        print_download_plan(plan)
+
+def start_service():
+    """Modo serviço: sem menus, processa a fila de jobs recebida pela API HTTP."""
+    client = authenticate()
+    if not client:
+        print("❌ Por favor, autentique-se primeiro executando o script de configuração.")
+        return
+    try:
+        cache_path()
+        run_service(client)
+    finally:
+        client.stop()
 
 def main():
     """Função principal"""
+    args = parse_args()
+    if args.quiet:
+        # A saída padrão fica só com os eventos JSON, para ser lida por outro programa
+        progress.use_json_lines(sys.stdout)
+        with contextlib.redirect_stdout(sys.stderr):
+            run(args)
+    else:
+        run(args)
+
+def run(args):
+    """Executa o modo escolhido na linha de comando."""
     show_banner()
     
     # Verificar argumentos de linha de comando
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--clean-sessions":
-            force_clean_sessions()
-            return
-        elif sys.argv[1] == "--help":
-            print("Uso: python main.py [opção]")
-            print("Opções:")
-            print("  --clean-sessions  Limpa todas as sessões forçadamente")
-            print("  --help            Mostra esta ajuda")
-            return
+    if args.clean_sessions:
+        force_clean_sessions()
+        return
+    if args.service:
+        start_service()
+        return
+    if args.plan is not None:
+        show_plan(args)
+        return
     
-    # Verifica autenticação primeiro
-    if not authenticate():
+    # Verifica autenticação primeiro; o cliente conectado é usado em todas as etapas
+    client = authenticate()
+    if not client:
         print("❌ Por favor, autentique-se primeiro executando o script de configuração.")
         return
     
-    cache_path()
-    
-    # Obtém o canal/grupo
-    channel_source, chat_title, is_forum = get_channel()
-    
-    topic_id = None
-    
-    # Se for um fórum, lista e seleciona o tópico
-    if is_forum == 'IS_FORUM':
-        topic_id = select_topic_from_chat(channel_source, chat_title)
-        time.sleep(5)
-    # Inicia o download SEMPRE com todos os tipos de mídia
-
-    download_media_from_channel(channel_source, chat_title, topic_id) 
-    rename_files(VIDEO_PATH, chat_title)
+    metrics_writer = MetricsFileWriter().start()
+    try:
+        cache_path()
+        
+        # Obtém o canal/grupo
+        channel_source, chat_title, is_forum = get_channel(client)
+        
+        topic_id = None
+        
+        # Se for um fórum, lista e seleciona o tópico
+        if is_forum == 'IS_FORUM':
+            topic_id = select_topic_from_chat(client, channel_source, chat_title)
+        # Inicia o download com os tipos de mídia escolhidos (padrão: todos)
+        stats = download_media_from_channel(client, channel_source, chat_title, topic_id, args.types, args.scan,
+                                            history_window(args))
+        if stats and progress.json_lines:
+            progress.emit({'event': 'summary', 'chat': chat_title,
+                           **{key: value for key, value in stats.items() if key != 'lock'}})
+        rename_files(VIDEO_PATH, chat_title)
+    finally:
+        metrics_writer.stop()
+        client.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
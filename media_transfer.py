@@ -0,0 +1,225 @@
+"""Transferência de arquivos em faixas, com retomada de downloads interrompidos"""
+import os
+import math
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from metrics import metrics
+from bandwidth_limiter import bandwidth_limiter
+from config import BANDWIDTH_PRIORITY_SIZE
+from utils import preallocate_file, fsync_file, fsync_handle, directory_syncer
+
+# O stream_media entrega pedaços fixos de 1 MiB; offsets e limites são contados em chunks
+CHUNK_SIZE = 1024 * 1024
+
+# A cada quantos chunks de uma faixa o progresso é gravado no arquivo de controle
+SIDECAR_SAVE_INTERVAL = 8
+
+def split_ranges(file_size, parts):
+    """Divide o arquivo em faixas (primeiro_chunk, quantidade_de_chunks)."""
+    total_chunks = max(1, math.ceil(file_size / CHUNK_SIZE))
+    parts = max(1, min(parts, total_chunks))
+    per_part = math.ceil(total_chunks / parts)
+    return [(first, min(per_part, total_chunks - first)) for first in range(0, total_chunks, per_part)]
+
+def expected_range_bytes(file_size, first_chunk, chunk_count):
+    """Quantidade de bytes que uma faixa deve conter."""
+    start = first_chunk * CHUNK_SIZE
+    end = min((first_chunk + chunk_count) * CHUNK_SIZE, file_size)
+    return max(0, end - start)
+
+def get_part_paths(file_name):
+    """Retorna os caminhos do arquivo parcial e do seu arquivo de controle."""
+    part_path = f"{file_name}.part"
+    return part_path, f"{part_path}.json"
+
+def finalize_partial(part_path, file_name):
+    """Leva o .part completo para o disco e o renomeia atomicamente para file_name.
+
+    Com o fsync antes do os.replace, um arquivo com o nome final nunca fica com
+    conteúdo faltando depois de uma queda; o fsync do diretório é agrupado.
+    """
+    fsync_file(part_path)
+    os.replace(part_path, file_name)
+    directory_syncer.schedule(file_name)
+
+def remove_partial(file_name):
+    """Apaga o arquivo parcial e o arquivo de controle, se existirem."""
+    for path in get_part_paths(file_name):
+        if os.path.exists(path):
+            try: os.remove(path)
+            except: pass
+
+def _save_sidecar(sidecar_path, state):
+    """Grava o arquivo de controle de forma atômica (e durável antes de substituir o anterior)."""
+    temp_path = f"{sidecar_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+        fsync_handle(f)
+    os.replace(temp_path, sidecar_path)
+
+def _load_resume_state(file_name, file_size, file_unique_id):
+    """Carrega o progresso salvo se ele ainda corresponder à mesma mídia."""
+    part_path, sidecar_path = get_part_paths(file_name)
+    if not os.path.exists(part_path) or not os.path.exists(sidecar_path):
+        return None
+
+    try:
+        with open(sidecar_path, 'r') as f:
+            state = json.load(f)
+    except Exception:
+        return None
+
+    same_source = (
+        state.get('file_unique_id') == file_unique_id and
+        state.get('file_size') == file_size and
+        os.path.getsize(part_path) == file_size
+    )
+    if not same_source:
+        tqdm.write(f"   🔄 Arquivo parcial não corresponde à mídia atual, reiniciando: {os.path.basename(file_name)}")
+        return None
+
+    return state
+
+def _download_range(client, media, part_path, index, state, on_chunk, save_progress, stop_event, priority):
+    """Baixa (ou continua) uma faixa e a grava na posição correta do arquivo parcial."""
+    first_chunk, chunk_count, done = state['ranges'][index]
+    if done >= expected_range_bytes(state['file_size'], first_chunk, chunk_count):
+        return done
+
+    # Só chunks completos contam; o resto da faixa é baixado de novo
+    done_chunks = done // CHUNK_SIZE
+    written = done_chunks * CHUNK_SIZE
+    remaining = chunk_count - done_chunks
+
+    with open(part_path, 'r+b') as f:
+        f.seek((first_chunk + done_chunks) * CHUNK_SIZE)
+        received = 0
+        started = time.monotonic()
+        try:
+            for chunk in client.stream_media(media, offset=first_chunk + done_chunks, limit=remaining):
+                if stop_event.is_set():
+                    break
+                if not received:
+                    metrics.observe('time_to_first_byte_seconds', time.monotonic() - started)
+                f.write(chunk)
+                written += len(chunk)
+                received += 1
+                on_chunk(len(chunk))
+                # O próximo pedaço só é pedido depois de respeitar o limite de banda
+                bandwidth_limiter.consume(len(chunk), priority)
+                metrics.inc('transferred_bytes', len(chunk))
+                if received % SIDECAR_SAVE_INTERVAL == 0:
+                    # O controle só marca bytes que já estão no disco: depois de uma
+                    # queda, a faixa nunca é retomada de um trecho que não foi gravado
+                    fsync_handle(f)
+                    save_progress(index, written)
+        finally:
+            # Registra o que já está no disco, mesmo se a transferência falhou
+            fsync_handle(f)
+            save_progress(index, written)
+
+    return written
+
+def download_media_to_file(client, media, file_name, file_size, parts=1, progress=None):
+    """Baixa uma mídia em uma ou mais faixas, retomando de um .part existente.
+
+    O .part é pré-alocado com o tamanho final e cada faixa escreve no seu próprio
+    deslocamento. O arquivo .part.json guarda o file_unique_id e quanto de cada
+    faixa já foi gravado; se a mídia mudou, o download recomeça do zero. Só depois
+    de todas as faixas conferirem o arquivo vai para o disco e é movido para
+    file_name, então um arquivo com o nome final está sempre completo.
+    """
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    part_path, sidecar_path = get_part_paths(file_name)
+    file_unique_id = getattr(media, 'file_unique_id', None)
+
+    state = _load_resume_state(file_name, file_size, file_unique_id)
+    if state is None:
+        remove_partial(file_name)
+        with open(part_path, 'wb') as f:
+            preallocate_file(f, file_size)
+        state = {
+            'file_unique_id': file_unique_id,
+            'file_size': file_size,
+            'ranges': [[first, count, 0] for first, count in split_ranges(file_size, parts)]
+        }
+        _save_sidecar(sidecar_path, state)
+    else:
+        already = sum(done for _, _, done in state['ranges'])
+        tqdm.write(f"   ⏯️  Retomando {os.path.basename(file_name)} a partir de {already / (1024*1024):.2f} MB")
+
+    stop_event = threading.Event()
+    lock = threading.Lock()
+    received = [sum(
+        done if done >= expected_range_bytes(file_size, first, count) else (done // CHUNK_SIZE) * CHUNK_SIZE
+        for first, count, done in state['ranges']
+    )]
+
+    def on_chunk(size):
+        with lock:
+            received[0] += size
+            current = received[0]
+        if progress:
+            progress(current, file_size)
+
+    def save_progress(index, written):
+        with lock:
+            state['ranges'][index][2] = written
+            _save_sidecar(sidecar_path, state)
+
+    if progress:
+        progress(received[0], file_size)
+
+    ranges = state['ranges']
+    priority = file_size <= BANDWIDTH_PRIORITY_SIZE
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [
+            pool.submit(_download_range, client, media, part_path, index, state,
+                        on_chunk, save_progress, stop_event, priority)
+            for index in range(len(ranges))
+        ]
+        try:
+            for future, (first, count, _) in zip(futures, ranges):
+                written = future.result()
+                expected = expected_range_bytes(file_size, first, count)
+                if written != expected:
+                    raise IOError(f"Faixa a partir do chunk {first} incompleta: {written}/{expected} bytes")
+        except Exception:
+            stop_event.set()
+            raise
+
+    finalize_partial(part_path, file_name)
+    os.remove(sidecar_path)
+    return file_name
+
+def stream_media_to_file(client, media, file_name, progress=None):
+    """Baixa uma mídia de tamanho desconhecido inteira, gravando em .part até terminar.
+
+    Sem tamanho não há faixas nem retomada, mas o limite de banda é respeitado.
+    """
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    part_path, _ = get_part_paths(file_name)
+    written = 0
+    started = time.monotonic()
+    with open(part_path, 'wb') as f:
+        for chunk in client.stream_media(media):
+            if not written:
+                metrics.observe('time_to_first_byte_seconds', time.monotonic() - started)
+            f.write(chunk)
+            written += len(chunk)
+            metrics.inc('transferred_bytes', len(chunk))
+            if progress:
+                progress(written, 0)
+            bandwidth_limiter.consume(len(chunk), priority=True)
+
+    finalize_partial(part_path, file_name)
+    return file_name
@@ -0,0 +1,170 @@
+"""Métricas da execução: vazão, latências, FloodWait e filas"""
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from config import (CACHE_DIRECTORY, METRICS_FILE, METRICS_INTERVAL, THROUGHPUT_HISTORY,
+                    THROUGHPUT_HISTORY_RUNS)
+
+# Quantos downloads recentes aparecem com a sua taxa individual
+RECENT_FILES = 20
+
+PROMETHEUS_PREFIX = 'tg_downloader'
+
+class Metrics:
+    """Contadores, medidores e tempos compartilhados por todas as threads.
+
+    Contadores só crescem (bytes, arquivos, FloodWait, tentativas); medidores
+    guardam o valor atual (filas, downloads ativos); tempos acumulam quantidade,
+    soma e máximo de cada observação (latência de página, tempo até o primeiro byte).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._counters = defaultdict(float)
+        self._gauges = defaultdict(float)
+        self._timings = {}
+        self._recent_files = deque(maxlen=RECENT_FILES)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def add_gauge(self, name, delta):
+        with self._lock:
+            self._gauges[name] += delta
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def record_download(self, file_name, size, seconds):
+        """Registra um download concluído e a sua taxa."""
+        rate = size / seconds if seconds > 0 else 0.0
+        with self._lock:
+            self._counters['downloaded_files'] += 1
+            self._counters['downloaded_bytes'] += size
+            self._recent_files.append({
+                'file': os.path.basename(file_name), 'bytes': size,
+                'seconds': round(seconds, 3), 'bytes_per_second': round(rate, 1)
+            })
+        self.observe('download_seconds', seconds)
+
+    def snapshot(self):
+        """Retorna um dicionário com todas as métricas atuais."""
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            counters = dict(self._counters)
+            return {
+                'started_at': self.started_at,
+                'elapsed_seconds': round(elapsed, 1),
+                'bytes_per_second': round(counters.get('downloaded_bytes', 0) / elapsed, 1),
+                'counters': counters,
+                'gauges': dict(self._gauges),
+                'timings': {
+                    name: {'count': count, 'sum': round(total, 3), 'max': round(peak, 3),
+                           'avg': round(total / count, 3) if count else 0.0}
+                    for name, (count, total, peak) in self._timings.items()
+                },
+                'recent_files': list(self._recent_files),
+            }
+
+    def to_prometheus(self):
+        """Formata as métricas no formato texto do Prometheus."""
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {PROMETHEUS_PREFIX}_bytes_per_second gauge",
+            f"{PROMETHEUS_PREFIX}_bytes_per_second {snapshot['bytes_per_second']}",
+        ]
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name} {value}")
+        for name, timing in sorted(snapshot['timings'].items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} summary")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_count {timing['count']}")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_sum {timing['sum']}")
+            # Um summary só tem _count, _sum e quantis: o máximo é uma família gauge própria
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_max gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_max {timing['max']}")
+        return "\n".join(lines) + "\n"
+
+class MetricsFileWriter:
+    """Grava periodicamente as métricas num arquivo JSON (de forma atômica)."""
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_INTERVAL, source=None):
+        self.path = path
+        self.interval = interval
+        self.source = source or metrics
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.path:
+            return self
+        directory = os.path.dirname(self.path) or CACHE_DIRECTORY
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.source.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"⚠️  Erro ao gravar métricas: {e}")
+
+    def stop(self):
+        """Encerra a gravação periódica, gravando uma última vez."""
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self.write()
+            record_throughput(self.source.snapshot())
+
+def load_throughput(path=THROUGHPUT_HISTORY):
+    """Execuções anteriores com downloads: lista de {finished_at, bytes, seconds}."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def record_throughput(snapshot, path=THROUGHPUT_HISTORY, keep=THROUGHPUT_HISTORY_RUNS):
+    """Acrescenta a vazão da execução ao histórico, se ela baixou alguma coisa."""
+    counters = snapshot['counters']
+    downloaded = counters.get('downloaded_bytes', 0)
+    seconds = counters.get('download_active_seconds', 0)
+    if not path or not downloaded or not seconds:
+        return
+    runs = load_throughput(path)[-(keep - 1):] if keep > 1 else []
+    runs.append({'finished_at': time.time(), 'bytes': downloaded, 'seconds': round(seconds, 3)})
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(runs, f, indent=2)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"⚠️  Erro ao gravar vazão: {e}")
+
+# Métricas únicas do processo (execução interativa ou modo serviço)
+metrics = Metrics()
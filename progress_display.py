@@ -0,0 +1,220 @@
+"""Progresso agregado dos downloads: painel único no terminal ou eventos JSON por linha"""
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from tqdm import tqdm
+from config import PROGRESS_REFRESH_INTERVAL, PROGRESS_RATE_WINDOW
+from metrics import metrics
+
+class ProgressSession:
+    """Trabalho de um pool de downloads (chat ou tópico) dentro do painel.
+
+    Com total_files/total_bytes conhecidos (cache) o painel mostra o total desde o
+    início; sem eles (histórico em streaming) o total cresce conforme os arquivos
+    entram na fila, e o ETA só aparece quando a busca termina.
+    """
+
+    def __init__(self, total_files=None, total_bytes=None):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.queued_files = 0
+        self.queued_bytes = 0
+        self.discovering = total_files is None
+
+    def expected(self):
+        if self.total_files is None:
+            return self.queued_files, self.queued_bytes
+        return max(self.total_files, self.queued_files), max(self.total_bytes or 0, self.queued_bytes)
+
+class FileProgress:
+    """Callback de progresso de um arquivo: repassa só o incremento ao painel."""
+
+    def __init__(self, reporter):
+        self.reporter = reporter
+        self.received = 0
+
+    def __call__(self, current, total):
+        delta = current - self.received
+        self.received = current
+        self.reporter.add_bytes(delta)
+
+class ProgressReporter:
+    """Progresso de todos os downloads do processo.
+
+    Os workers só atualizam contadores; uma thread redesenha uma única barra a
+    cada PROGRESS_REFRESH_INTERVAL segundos, com bytes, arquivos, taxa, ETA e
+    transferências ativas. No modo JSON (--quiet) não há painel: cada arquivo
+    concluído ou com erro vira uma linha compacta no stream escolhido. O tempo
+    com algum pool ativo vai para a métrica download_active_seconds, base do
+    ETA do --plan (o tempo ocioso do modo serviço não conta).
+    """
+
+    def __init__(self, interval=PROGRESS_REFRESH_INTERVAL, rate_window=PROGRESS_RATE_WINDOW):
+        self.interval = interval
+        self.rate_window = rate_window
+        self.stream = None
+        self._lock = threading.Lock()
+        self._sessions_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sessions = []
+        self._bar = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._reset()
+
+    @property
+    def json_lines(self):
+        return self.stream is not None
+
+    def use_json_lines(self, stream=None):
+        """Troca o painel por eventos JSON (uma linha por arquivo) em stream."""
+        self.stream = stream or sys.stdout
+
+    def _reset(self):
+        self.files_done = 0
+        self.files_failed = 0
+        self.bytes_done = 0
+        self.active = 0
+        self._samples = deque([(time.monotonic(), 0)])
+        self._opened_at = time.monotonic()
+
+    @contextmanager
+    def session(self, total_files=None, total_bytes=None):
+        """Registra um pool de downloads; o painel existe enquanto houver algum."""
+        session = ProgressSession(total_files, total_bytes)
+        with self._sessions_lock:
+            if not self._sessions:
+                with self._lock:
+                    self._reset()
+                if not self.json_lines:
+                    self._open_bar()
+            self._sessions.append(session)
+        try:
+            yield session
+        finally:
+            with self._sessions_lock:
+                if self._sessions == [session]:
+                    # O último desenho ainda conta com os totais desta sessão
+                    self._close_bar()
+                    metrics.inc('download_active_seconds', time.monotonic() - self._opened_at)
+                self._sessions.remove(session)
+
+    def queued(self, session, size):
+        """Um arquivo entrou na fila de downloads da sessão."""
+        with self._lock:
+            session.queued_files += 1
+            session.queued_bytes += size or 0
+
+    def discovery_done(self, session):
+        """A busca da sessão terminou: o total de arquivos não cresce mais."""
+        with self._lock:
+            session.discovering = False
+
+    def transfer_started(self):
+        with self._lock:
+            self.active += 1
+
+    def transfer_finished(self):
+        with self._lock:
+            self.active -= 1
+
+    def add_bytes(self, size):
+        with self._lock:
+            self.bytes_done += size
+
+    def tracker(self):
+        """Retorna o callback de progresso de um novo arquivo."""
+        return FileProgress(self)
+
+    def file_done(self, status, record, file_name, size, seconds=None, received=None, method=None):
+        """Registra um arquivo concluído ('downloaded', 'linked') ou com erro ('failed').
+
+        received é quanto do arquivo já foi contado pelo callback de progresso; o
+        restante do tamanho é somado agora para o total de bytes fechar. method é
+        como um arquivo reaproveitado foi criado ('hardlink' ou 'copy').
+        """
+        with self._lock:
+            if status == 'failed':
+                self.files_failed += 1
+            else:
+                self.files_done += 1
+            self.bytes_done += (size or 0) - (received or 0)
+        if self.json_lines:
+            event = {'event': 'file', 'status': status, 'id': record.id, 'file': file_name, 'bytes': size}
+            if seconds is not None:
+                event['seconds'] = round(seconds, 3)
+            if method:
+                event['method'] = method
+            self.emit(event)
+
+    def emit(self, event):
+        """Escreve um evento JSON numa única linha."""
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+        with self._write_lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def _open_bar(self):
+        self._bar = tqdm(
+            total=1,
+            unit='B',
+            unit_scale=True,
+            unit_divisor=1024,
+            ncols=120,
+            mininterval=self.interval,
+            bar_format='   🚀 {percentage:3.0f}%|{bar:30}| {n_fmt}/{total_fmt} {desc}',
+            colour="#276827"
+        )
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _close_bar(self):
+        if not self._bar:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._redraw()
+        self._bar.close()
+        self._bar = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._redraw()
+
+    def _redraw(self):
+        now = time.monotonic()
+        with self._lock:
+            expected = [session.expected() for session in self._sessions]
+            total_files = sum(files for files, _ in expected)
+            total_bytes = sum(size for _, size in expected)
+            discovering = any(session.discovering for session in self._sessions)
+            files_done, files_failed, bytes_done, active = (self.files_done, self.files_failed,
+                                                            self.bytes_done, self.active)
+            # Taxa pelos bytes recebidos na janela recente (não pela média desde o início)
+            self._samples.append((now, bytes_done))
+            while len(self._samples) > 2 and now - self._samples[0][0] > self.rate_window:
+                self._samples.popleft()
+            first_time, first_bytes = self._samples[0]
+        rate = (bytes_done - first_bytes) / (now - first_time) if now > first_time else 0.0
+
+        remaining = max(total_bytes - bytes_done, 0)
+        if discovering or not rate:
+            eta = "--:--"
+        else:
+            eta = tqdm.format_interval(remaining / rate)
+        status = (f"| 📄 {files_done}/{total_files}{'+' if discovering else ''} | "
+                   f"{tqdm.format_sizeof(rate, 'B/s', 1024)} | ETA {eta} | ativos: {active}")
+        if files_failed:
+            status += f" | ❌ {files_failed}"
+
+        self._bar.total = max(total_bytes, bytes_done, 1)
+        self._bar.n = bytes_done
+        self._bar.set_description_str(status, refresh=False)
+        self._bar.refresh()
+
+# Progresso único do processo (vários jobs do modo serviço dividem o mesmo painel)
+progress = ProgressReporter()
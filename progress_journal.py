@@ -0,0 +1,127 @@
+"""Diário de progresso dos downloads, gravado em lote"""
+import os
+import time
+import sqlite3
+import threading
+from config import TASK_DIRECTORY, JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL
+from utils import limpar_nome_arquivo, connect_read_only
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completed (
+    message_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    file_name TEXT,
+    file_size INTEGER,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS file_names (
+    message_id INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def get_journal_path(chat_title, channel_source, topic_id=None, create_directory=True):
+    """Retorna o caminho do diário de progresso de um chat (ou de um tópico dele)."""
+    if create_directory and not os.path.exists(TASK_DIRECTORY):
+        os.makedirs(TASK_DIRECTORY)
+    safe_channel_source = limpar_nome_arquivo(str(channel_source))
+    suffix = f"_topic{topic_id}" if topic_id is not None else ""
+    return os.path.join(TASK_DIRECTORY, f"{limpar_nome_arquivo(chat_title)}_{safe_channel_source}{suffix}.sqlite")
+
+class ProgressJournal:
+    """Registra as mensagens já concluídas de um chat para retomar execuções.
+
+    As marcações ficam em memória e são gravadas juntas a cada JOURNAL_BATCH_SIZE
+    mensagens ou JOURNAL_FLUSH_INTERVAL segundos, e sempre no close(). O SQLite
+    em modo WAL garante que uma queda perca no máximo o último lote, sem corromper
+    o que já foi gravado. Com read_only um diário existente é só consultado.
+    """
+
+    def __init__(self, chat_title, channel_source, topic_id=None, batch_size=JOURNAL_BATCH_SIZE,
+                 flush_interval=JOURNAL_FLUSH_INTERVAL, verbose=True, read_only=False):
+        self.path = get_journal_path(chat_title, channel_source, topic_id, create_directory=not read_only)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_names = []
+        self._last_flush = time.monotonic()
+
+        if read_only:
+            self._conn = connect_read_only(self.path)
+        else:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self._done = {row[0] for row in self._conn.execute("SELECT message_id FROM completed")}
+
+        if verbose:
+            if self._done:
+                print(f"⏯️  Progresso anterior encontrado: {len(self._done)} mensagens já concluídas")
+            else:
+                print("▶️ Iniciando download do zero.")
+
+    def is_done(self, message_id):
+        return message_id in self._done
+
+    def mark(self, message_id, status, file_name=None, file_size=None):
+        """Marca uma mensagem como concluída ('text', 'existing' ou 'downloaded')."""
+        with self._lock:
+            self._done.add(message_id)
+            self._pending.append((message_id, status, file_name, file_size, time.time()))
+            due = (len(self._pending) >= self.batch_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+            if due:
+                self._flush_locked()
+
+    def file_names(self):
+        """Nomes de arquivo já usados por mensagem (os reservados e os dos concluídos)."""
+        with self._lock:
+            names = {message_id: os.path.basename(file_name) for message_id, file_name in self._conn.execute(
+                "SELECT message_id, file_name FROM completed WHERE file_name IS NOT NULL"
+            )}
+            names.update(self._conn.execute("SELECT message_id, file_name FROM file_names"))
+            names.update(self._pending_names)
+        return names
+
+    def record_file_name(self, message_id, file_name):
+        """Guarda o nome escolhido para a mensagem (gravado junto com o próximo lote)."""
+        with self._lock:
+            self._pending_names.append((message_id, file_name))
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending or self._pending_names:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO file_names VALUES (?, ?)", self._pending_names
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO completed VALUES (?, ?, ?, ?, ?)", self._pending
+                )
+            self._pending = []
+            self._pending_names = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
@@ -0,0 +1,129 @@
+"""Controle de ritmo das chamadas de histórico à API do Telegram"""
+import time
+import asyncio
+import threading
+from pyrogram import errors
+from tqdm import tqdm
+from metrics import metrics
+from config import (HISTORY_START_INTERVAL, HISTORY_MIN_INTERVAL, HISTORY_MAX_INTERVAL,
+                    HISTORY_MAX_RETRIES)
+
+# Ajuste do intervalo: acelera aos poucos sem FloodWait, freia forte depois de um
+SPEEDUP_FACTOR = 0.9
+SLOWDOWN_FACTOR = 2.0
+
+def is_transient_error(error):
+    """Erros de rede/servidor que valem uma nova tentativa em vez de encerrar a busca."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError, errors.InternalServerError)):
+        return True
+    return "timeout" in str(error).lower()
+
+class AdaptiveRateLimiter:
+    """Espaça as chamadas à API e se adapta aos FloodWait recebidos.
+
+    Compartilhado entre threads: cada chamada reserva o próximo horário livre.
+    Um FloodWait bloqueia todas as chamadas pelo tempo exato pedido pelo servidor.
+    """
+
+    def __init__(self, start_interval=HISTORY_START_INTERVAL, min_interval=HISTORY_MIN_INTERVAL,
+                 max_interval=HISTORY_MAX_INTERVAL, max_retries=HISTORY_MAX_RETRIES):
+        self.interval = start_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_retries = max_retries
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Aguarda até o próximo horário permitido para uma chamada."""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.interval = max(self.min_interval, self.interval * SPEEDUP_FACTOR)
+
+    def on_flood_wait(self, seconds):
+        with self._lock:
+            self.interval = min(self.max_interval, self.interval * SLOWDOWN_FACTOR)
+            self._next_call = max(self._next_call, time.monotonic() + seconds)
+        metrics.inc('flood_waits')
+        metrics.inc('flood_wait_seconds', seconds)
+        # A paginação roda junto com os downloads: tqdm.write não quebra o painel
+        tqdm.write(f"⏳ FloodWait: aguardando {seconds}s (intervalo agora {self.interval:.1f}s)")
+
+    def _backoff(self, attempt, error):
+        """Espera exponencial antes de repetir após um erro transitório."""
+        delay = min(self.max_interval * 6, 2 ** attempt)
+        metrics.inc('retries')
+        tqdm.write(f"⚠️  Erro temporário ({error}). Tentativa {attempt}/{self.max_retries} em {delay:.0f}s...")
+        time.sleep(delay)
+
+    def call(self, func, *args, **kwargs):
+        """Executa func respeitando o ritmo, repetindo após FloodWait e timeouts."""
+        attempt = 0
+        while True:
+            self.wait()
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except errors.FloodWait as e:
+                self.on_flood_wait(e.value)
+                continue
+            except Exception as e:
+                if not is_transient_error(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._backoff(attempt, e)
+                continue
+            metrics.observe('history_page_seconds', time.monotonic() - started)
+            self.on_success()
+            return result
+
+    def iterate(self, factory, page_size=100):
+        """Percorre um gerador paginado do Pyrogram respeitando o ritmo.
+
+        factory(consumidos) deve devolver um iterador que começa após os itens já
+        entregues; ele é recriado quando a iteração é interrompida por FloodWait
+        ou erro transitório.
+        """
+        consumed = 0
+        attempt = 0
+        while True:
+            self.wait()
+            try:
+                items = iter(factory(consumed))
+                # Só o tempo dentro do gerador conta como latência da página
+                page_seconds = 0.0
+                while True:
+                    started = time.monotonic()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        break
+                    page_seconds += time.monotonic() - started
+                    yield item
+                    consumed += 1
+                    attempt = 0
+                    # A próxima página só é pedida quando o gerador avança
+                    if consumed % page_size == 0:
+                        metrics.observe('history_page_seconds', page_seconds)
+                        page_seconds = 0.0
+                        self.on_success()
+                        self.wait()
+                self.on_success()
+                return
+            except errors.FloodWait as e:
+                self.on_flood_wait(e.value)
+            except Exception as e:
+                if not is_transient_error(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._backoff(attempt, e)
+
+# Limitador único para toda a paginação de histórico, tópicos e buscas
+history_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,310 @@
+"""Modo serviço: fila persistente de downloads com API HTTP local"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pyrogram import errors
+from config import (CACHE_DIRECTORY, SERVICE_DATABASE, SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_JOBS,
+                    SERVICE_POLL_INTERVAL, DEFAULT_CHOICES, VIDEO_PATH)
+from downloader import sync_channel, MEDIA_KIND_CHOICES
+from utils import run_in_client_loop, rename_files
+from metrics import metrics, MetricsFileWriter
+from bandwidth_limiter import bandwidth_limiter
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat TEXT NOT NULL,
+    topic TEXT,
+    choices TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chat_title TEXT,
+    stats TEXT,
+    error TEXT,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+_JOB_COLUMNS = ('id', 'chat', 'topic', 'choices', 'status', 'chat_title', 'stats', 'error',
+                'created_at', 'started_at', 'finished_at')
+
+def parse_topic(value):
+    """Converte o tópico de um job: None (chat inteiro), "ALL_TOPICS" ou o ID do tópico."""
+    if value in (None, '', -1, '-1'):
+        return None
+    if value in (0, '0', 'ALL_TOPICS'):
+        return 'ALL_TOPICS'
+    return int(value)
+
+def parse_choices(value):
+    """Valida as opções de tipo de mídia (1-4, como em DEFAULT_CHOICES)."""
+    if value is None:
+        return list(DEFAULT_CHOICES)
+    choices = sorted({int(choice) for choice in value})
+    valid = set(MEDIA_KIND_CHOICES.values())
+    if not choices or not set(choices) <= valid:
+        raise ValueError(f"Tipos de mídia inválidos: {value} (use {sorted(valid)})")
+    return choices
+
+class JobQueue:
+    """Fila de jobs gravada em SQLite; sobrevive a reinícios do serviço."""
+
+    def __init__(self, path=SERVICE_DATABASE):
+        if not os.path.exists(CACHE_DIRECTORY):
+            os.makedirs(CACHE_DIRECTORY)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _row_to_job(self, row):
+        job = dict(zip(_JOB_COLUMNS, row))
+        job['topic'] = parse_topic(job['topic'])
+        job['choices'] = json.loads(job['choices'])
+        job['stats'] = json.loads(job['stats']) if job['stats'] else None
+        return job
+
+    def submit(self, chat, topic=None, choices=None):
+        """Enfileira um job e o retorna.
+
+        Se um job idêntico (mesmo chat, tópico e tipos) ainda está na fila, ele é
+        retornado no lugar de um novo.
+        """
+        chat = str(chat).strip()
+        if not chat:
+            raise ValueError("Informe o chat (ID, @username ou link de convite)")
+        topic = parse_topic(topic)
+        choices = parse_choices(choices)
+        params = (chat, None if topic is None else str(topic), json.dumps(choices))
+        with self._lock:
+            with self._conn:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' AND chat = ? AND topic IS ? AND choices = ? "
+                    "ORDER BY id LIMIT 1", params
+                ).fetchone()
+                if row:
+                    job_id = row[0]
+                else:
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (chat, topic, choices, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                        (*params, time.time())
+                    ).lastrowid
+        return self.get(job_id)
+
+    def claim_next(self):
+        """Marca o job mais antigo da fila como em execução e o retorna (ou None).
+
+        Jobs de um chat que já tem um job rodando esperam a vez: os dois usariam o
+        mesmo cache e os mesmos arquivos .part.
+        """
+        with self._lock:
+            with self._conn:
+                row = self._conn.execute(
+                    f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE status = 'queued' AND chat NOT IN "
+                    "(SELECT chat FROM jobs WHERE status = 'running') ORDER BY id LIMIT 1"
+                ).fetchone()
+                if not row:
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, error = NULL WHERE id = ?",
+                    (time.time(), row[0])
+                )
+        job = self._row_to_job(row)
+        job['status'] = 'running'
+        return job
+
+    def update(self, job_id, **fields):
+        """Atualiza campos de um job (stats é gravado como JSON)."""
+        if 'stats' in fields and fields['stats'] is not None:
+            fields['stats'] = json.dumps(fields['stats'])
+        assignments = ', '.join(f"{key} = ?" for key in fields)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, status=None):
+        query = f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs"
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def requeue_interrupted(self):
+        """Devolve à fila os jobs que estavam rodando quando o serviço parou."""
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def resolve_chat(client, chat):
+    """Obtém o chat do job a partir do ID, @username ou link de convite."""
+    if chat.lstrip('-').isdigit():
+        return client.get_chat(int(chat))
+    try:
+        return client.join_chat(chat)
+    except errors.UserAlreadyParticipant:
+        return client.get_chat(chat)
+
+def run_job(client, jobs, job, stop_event):
+    """Executa um job da fila e registra o resultado."""
+    print(f"\n🛠️  Job {job['id']}: iniciando {job['chat']} (tópico: {job['topic'] or 'chat inteiro'})")
+    try:
+        chat = resolve_chat(client, job['chat'])
+        jobs.update(job['id'], chat_title=chat.title)
+
+        stats = sync_channel(client, chat.id, chat.title, job['topic'], job['choices'], interactive=False)
+        if stats:
+            stats = {key: value for key, value in stats.items() if key != 'lock'}
+        if job['topic'] is None:
+            rename_files(VIDEO_PATH, chat.title)
+
+        # Downloads com erro são tentados de novo numa próxima submissão do mesmo chat
+        status = 'failed' if stats and stats['errors'] else 'done'
+        jobs.update(job['id'], status=status, stats=stats, finished_at=time.time())
+        print(f"🏁 Job {job['id']}: {status}")
+    except Exception as e:
+        if stop_event.is_set():
+            # Interrompido pelo encerramento do serviço: volta para a fila
+            jobs.update(job['id'], status='queued')
+            return
+        jobs.update(job['id'], status='failed', error=str(e), finished_at=time.time())
+        print(f"❌ Job {job['id']} falhou: {e}")
+
+def schedule_jobs(client, jobs, max_jobs, stop_event):
+    """Retira jobs da fila e os executa, no máximo max_jobs ao mesmo tempo (um por chat)."""
+    running = set()
+    with ThreadPoolExecutor(max_workers=max_jobs) as pool:
+        while not stop_event.is_set():
+            running = {future for future in running if not future.done()}
+            while len(running) < max_jobs:
+                job = jobs.claim_next()
+                if not job:
+                    break
+                running.add(pool.submit(run_job, client, jobs, job, stop_event))
+            stop_event.wait(SERVICE_POLL_INTERVAL)
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """API JSON: GET /jobs, GET /jobs/<id> e POST /jobs; GET /metrics no formato do Prometheus.
+
+    GET/POST/DELETE /bandwidth consultam, mudam ({"rate": bytes/s ou null}) e
+    restauram o limite de banda da configuração.
+    """
+
+    def _bandwidth_status(self):
+        return {'rate': bandwidth_limiter.current_rate(), 'schedule': bandwidth_limiter.schedule}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['metrics']:
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ['bandwidth']:
+            self._send_json(200, self._bandwidth_status())
+        elif parts == ['jobs']:
+            self._send_json(200, jobs.list())
+        elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            job = jobs.get(int(parts[1]))
+            if job:
+                self._send_json(200, job)
+            else:
+                self._send_json(404, {'error': 'Job não encontrado'})
+        else:
+            self._send_json(404, {'error': 'Rota não encontrada'})
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        if path == '/bandwidth':
+            try:
+                rate = self._read_json().get('rate')
+                if rate is not None and int(rate) <= 0:
+                    raise ValueError("O limite deve ser positivo (ou null para sem limite)")
+                bandwidth_limiter.set_rate(None if rate is None else int(rate))
+            except (ValueError, TypeError, AttributeError) as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            self._send_json(200, self._bandwidth_status())
+            return
+        if path != '/jobs':
+            self._send_json(404, {'error': 'Rota não encontrada'})
+            return
+        try:
+            data = self._read_json()
+            job = self.server.jobs.submit(data.get('chat', ''), data.get('topic'), data.get('choices'))
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        print(f"📨 Job {job['id']} recebido: {job['chat']}")
+        self._send_json(201, job)
+
+    def do_DELETE(self):
+        if self.path.rstrip('/') != '/bandwidth':
+            self._send_json(404, {'error': 'Rota não encontrada'})
+            return
+        bandwidth_limiter.reset_rate()
+        self._send_json(200, self._bandwidth_status())
+
+    def log_message(self, format, *args):
+        # As requisições não poluem o log dos downloads
+        pass
+
+def run_service(client, host=SERVICE_HOST, port=SERVICE_PORT, max_jobs=SERVICE_MAX_JOBS):
+    """Roda o serviço até Ctrl+C: API HTTP numa thread, jobs no pool."""
+    jobs = JobQueue()
+    requeued = jobs.requeue_interrupted()
+    if requeued:
+        print(f"⏯️  {requeued} jobs interrompidos voltaram para a fila")
+
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.jobs = jobs
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🌐 API de jobs em http://{host}:{port}/jobs (até {max_jobs} jobs simultâneos)")
+
+    metrics_writer = MetricsFileWriter().start()
+    stop_event = threading.Event()
+    try:
+        # O agendador roda numa thread auxiliar enquanto o loop do cliente atende as chamadas
+        run_in_client_loop(client, schedule_jobs, client, jobs, max_jobs, stop_event)
+    except KeyboardInterrupt:
+        print("\n🛑 Encerrando serviço; jobs em andamento voltam para a fila na próxima execução.")
+    finally:
+        stop_event.set()
+        server.shutdown()
+        metrics_writer.stop()
@@ -4,7 +4,7 @@ import glob
 import sqlite3
 import time
 from pyrogram import Client
-from config import SESSION_NAME
+from config import SESSION_NAME, MAX_CONCURRENT_DOWNLOADS, PARALLEL_DOWNLOAD_PARTS
 
 def clean_old_sessions():
     """Remove arquivos de sessão antigos, mantendo apenas o atual."""
@@ -99,14 +99,26 @@ def recreate_session_if_needed():
             return False
     return True
 
+def create_client(api_id=None, api_hash=None):
+    """Cria o cliente único usado em toda a execução."""
+    # Cada download (e cada faixa de arquivo grande) usa uma transmissão própria
+    transmissions = MAX_CONCURRENT_DOWNLOADS * PARALLEL_DOWNLOAD_PARTS
+    return Client(SESSION_NAME, api_id=api_id, api_hash=api_hash,
+                  max_concurrent_transmissions=transmissions)
+
 def authenticate():
-    """Verifica se a sessão está autenticada, pedindo credenciais se necessário."""
+    """Verifica se a sessão está autenticada, pedindo credenciais se necessário.
+
+    Retorna o cliente já conectado (ou None em caso de falha); ele é reaproveitado
+    por todas as etapas e deve ser encerrado com client.stop() ao final.
+    """
+    app = None
     try:
         clean_old_sessions()
         
         if not recreate_session_if_needed():
             print("❌ Erro ao preparar ambiente da sessão.")
-            return False
+            return None
         
         session_file = f"{SESSION_NAME}.session"
         api_id = None
@@ -126,30 +138,34 @@ def authenticate():
                 
                 if not user_api_id or not user_api_hash:
                     print("❌ Dados vazios. Tente novamente.")
-                    return False
+                    return None
                     
                 api_id = int(user_api_id)
                 api_hash = user_api_hash
                 
             except ValueError:
                 print("❌ O API_ID deve conter apenas números.")
-                return False
+                return None
         # ---------------------------------------------
 
         # Inicializa o cliente. Se api_id/hash forem None, ele tenta usar a sessão existente.
         # Se forem fornecidos, ele usa para criar a nova conexão.
         print("\n🔄 Conectando aos servidores do Telegram...")
-        app = Client(SESSION_NAME, api_id=api_id, api_hash=api_hash)
+        app = create_client(api_id, api_hash)
+        app.start()
 
-        with app as client:
-            me = client.get_me()
-            print(f"✅ \033[1mAutenticado com sucesso!\033[0m")
-            print(f"   Usuário: {me.first_name} (@{me.username})")
-            print(f"   ID: {me.id}")
-            print(f"   Arquivo de sessão criado: {session_file}")
-            return True
+        me = app.get_me()
+        print(f"✅ \033[1mAutenticado com sucesso!\033[0m")
+        print(f"   Usuário: {me.first_name} (@{me.username})")
+        print(f"   ID: {me.id}")
+        print(f"   Arquivo de sessão criado: {session_file}")
+        return app
 
     except Exception as e:
+        if app is not None and app.is_connected:
+            try: app.stop()
+            except: pass
+
         print(f"\n❌ \033[1mErro de autenticação:\033[0m {e}")
         
         if "API_ID_INVALID" in str(e) or "API_HASH_INVALID" in str(e):
@@ -162,7 +178,7 @@ def authenticate():
             if os.path.exists(f"{SESSION_NAME}.session"):
                 os.remove(f"{SESSION_NAME}.session")
         
-        return False
+        return None
 
 def force_clean_sessions():
     """Limpeza forçada de todas as sessões."""
@@ -0,0 +1,125 @@
+"""Testes da atualização incremental do cache contra o cliente falso (python -m unittest)"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+import downloader
+from pyrogram import errors
+from fake_client import FakeTelegramClient, generate_history
+from cache_manager import load_messages_from_cache, load_history_bounds, sync_topic_cache, iter_cached_topic_records
+from rate_limiter import history_limiter
+
+CHAT_TITLE = "Refresh"
+
+class InterruptedClient(FakeTelegramClient):
+    """Cliente falso que falha uma vez ao buscar a página/lote que contém fail_id."""
+
+    def __init__(self, messages, fail_id):
+        super().__init__(messages)
+        self.fail_id = fail_id
+
+    def _fail_once(self, ids):
+        if self.fail_id in ids:
+            self.fail_id = None
+            raise RuntimeError("conexão encerrada pelo servidor")
+
+    def get_chat_history(self, chat_id, limit=0, offset_id=0, offset_date=None, min_id=0, max_id=0):
+        messages = list(super().get_chat_history(chat_id, limit, offset_id, offset_date, min_id, max_id))
+        if limit > 1 and messages:
+            self._fail_once(range(messages[-1].id, messages[0].id + 1))
+        return messages
+
+    def get_messages(self, chat_id, message_ids):
+        self._fail_once(message_ids)
+        return super().get_messages(chat_id, message_ids)
+
+class InterruptedRepliesClient(FakeTelegramClient):
+    """Cliente falso cuja página de respostas com offset_id == fail_offset recebe um FloodWait."""
+
+    def __init__(self, messages, fail_offset):
+        super().__init__(messages)
+        self.fail_offset = fail_offset
+        self.offsets = []
+
+    def invoke(self, query):
+        self.offsets.append(query.offset_id)
+        if query.offset_id == self.fail_offset:
+            self.fail_offset = None
+            raise errors.FloodWait(value=0)
+        return super().invoke(query)
+
+class HistoryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        # Os caminhos de config.py são relativos: o cache fica num diretório temporário
+        directory = tempfile.mkdtemp(prefix='tg_refresh_test_')
+        previous = os.getcwd()
+        os.chdir(directory)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.addCleanup(os.chdir, previous)
+        interval = history_limiter.interval, history_limiter.min_interval
+        history_limiter.interval = history_limiter.min_interval = 0.0
+        self.addCleanup(setattr, history_limiter, 'interval', interval[0])
+        self.addCleanup(setattr, history_limiter, 'min_interval', interval[1])
+
+class RefreshCachedMessagesTest(HistoryCacheTest):
+
+    def refresh(self, client, scan_mode):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            cache_data = load_messages_from_cache(client.chat_id, CHAT_TITLE)
+            return list(downloader.refresh_cached_messages(client, client.chat_id, CHAT_TITLE, cache_data,
+                                                           scan_mode))
+
+    def check_interrupted_refresh(self, scan_mode, fail_id):
+        messages = generate_history(900)
+        # Cache completo até o ID 500; depois o chat cresce até 900
+        old_client = FakeTelegramClient(messages[:500])
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            list(downloader.fetch_history_records(old_client, old_client.chat_id, CHAT_TITLE, scan_mode=scan_mode))
+
+        client = InterruptedClient(messages, fail_id)
+        self.refresh(client, scan_mode)
+        bounds = load_history_bounds(client.chat_id, CHAT_TITLE)
+        # A atualização parou no meio: os limites não podem pular o trecho que faltou
+        self.assertEqual(bounds['max_id'], 500)
+        self.assertIsNotNone(bounds['pending'])
+
+        records = self.refresh(client, scan_mode)
+        self.assertEqual(sorted(record.id for record in records), list(range(1, 901)))
+        self.assertEqual([record.id for record in records], sorted((record.id for record in records), reverse=True))
+        bounds = load_history_bounds(client.chat_id, CHAT_TITLE)
+        self.assertEqual((bounds['max_id'], bounds['min_id'], bounds['pending']), (900, 1, None))
+
+        records = self.refresh(client, scan_mode)
+        self.assertEqual(len(records), 900)
+
+    def test_pages_refresh_resumes_after_interruption(self):
+        # Páginas de 100: a segunda (IDs 800..701) falha
+        self.check_interrupted_refresh('pages', 750)
+
+    def test_ids_refresh_resumes_after_interruption(self):
+        # Lotes de 200 IDs: o segundo (IDs 501..700) falha
+        self.check_interrupted_refresh('ids', 600)
+
+class TopicRepliesTest(HistoryCacheTest):
+
+    def test_replies_resume_from_last_message_after_timeout(self):
+        messages = generate_history(1000, topics=2)
+        topic_replies = sorted((message.id for message in messages if message.message_thread_id == 2), reverse=True)
+        # A terceira página (após as 200 respostas mais recentes) cai num FloodWait
+        fail_offset = topic_replies[199]
+        client = InterruptedRepliesClient(messages, fail_offset)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            total = sync_topic_cache(client, client.chat_id, CHAT_TITLE, 2)
+
+        self.assertEqual(total, len(topic_replies))
+        # Só a página que falhou é pedida de novo, com o mesmo offset_id
+        pages = [0] + topic_replies[99::100] + ([topic_replies[-1]] if len(topic_replies) % 100 else [])
+        self.assertEqual(client.offsets, pages[:3] + pages[2:])
+        records = iter_cached_topic_records(client.chat_id, CHAT_TITLE, 2)
+        self.assertEqual([record.id for record in records], sorted(topic_replies))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Testes do download em faixas contra o cliente falso (python -m unittest)"""
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from fake_client import FakeTelegramClient, media_content
+from media_transfer import download_media_to_file, get_part_paths, CHUNK_SIZE
+
+class FailingClient(FakeTelegramClient):
+    """Cliente falso cuja primeira faixa a partir de fail_offset cai depois de fail_after chunks."""
+
+    def __init__(self, fail_offset, fail_after):
+        super().__init__([])
+        self.fail_offset = fail_offset
+        self.fail_after = fail_after
+        self.offsets = []
+
+    def stream_media(self, media, offset=0, limit=0):
+        self.offsets.append(offset)
+        for sent, chunk in enumerate(super().stream_media(media, offset, limit)):
+            if offset == self.fail_offset and self.fail_after is not None and sent == self.fail_after:
+                self.fail_after = None
+                raise ConnectionError("conexão perdida no meio da faixa")
+            yield chunk
+
+class DownloadMediaToFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='tg_transfer_test_')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def media(self, file_size, name='media'):
+        return SimpleNamespace(file_size=file_size, file_unique_id=f"uniq_{name}")
+
+    def assert_downloaded(self, file_name, media):
+        with open(file_name, 'rb') as f:
+            self.assertEqual(f.read(), media_content(media))
+        for path in get_part_paths(file_name):
+            self.assertFalse(os.path.exists(path))
+
+    def test_parts_write_every_range_at_its_offset(self):
+        # Tamanho que não é múltiplo do chunk: a última faixa termina no meio de um chunk
+        file_size = 5 * CHUNK_SIZE + 12345
+        for parts in (1, 2, 4):
+            with self.subTest(parts=parts):
+                media = self.media(file_size, f"parts{parts}")
+                file_name = os.path.join(self.directory, f"parts{parts}.bin")
+                download_media_to_file(FakeTelegramClient([]), media, file_name, file_size, parts)
+                self.assert_downloaded(file_name, media)
+
+    def test_file_smaller_than_one_chunk(self):
+        media = self.media(1000)
+        file_name = os.path.join(self.directory, 'small.bin')
+        download_media_to_file(FakeTelegramClient([]), media, file_name, media.file_size, parts=4)
+        self.assert_downloaded(file_name, media)
+
+    def test_resume_after_failure_inside_a_range(self):
+        # Duas faixas: chunks 0-3 e 4-6; a segunda cai depois de gravar os chunks 4 e 5
+        file_size = 6 * CHUNK_SIZE + 777
+        media = self.media(file_size)
+        file_name = os.path.join(self.directory, 'resume.bin')
+        client = FailingClient(fail_offset=4, fail_after=2)
+
+        with self.assertRaises(ConnectionError):
+            download_media_to_file(client, media, file_name, file_size, parts=2)
+        self.assertFalse(os.path.exists(file_name))
+        self.assertTrue(all(os.path.exists(path) for path in get_part_paths(file_name)))
+
+        client.offsets.clear()
+        download_media_to_file(client, media, file_name, file_size, parts=2)
+        # Só o que faltava da segunda faixa é pedido de novo
+        self.assertEqual(client.offsets, [6])
+        self.assert_downloaded(file_name, media)
+
+if __name__ == '__main__':
+    unittest.main()
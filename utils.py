@@ -9,66 +9,263 @@
 """Funções utilitárias"""
 import os
 import re
-import json
-from config import TASK_DIRECTORY
+import queue
+import functools
+import asyncio
+import time
+import sqlite3
+import threading
+from urllib.request import pathname2url
+from tqdm import tqdm
+from config import PREALLOCATE_FILES, FSYNC_FILES, DIRECTORY_FSYNC_INTERVAL
 
+# Caracteres inválidos em nomes de arquivo (Windows) trocados por '_' numa única passada
+_INVALID_CHARS = str.maketrans({char: '_' for char in '<>:"/\\|?*\n\r'})
+_REPEATED_UNDERSCORES = re.compile(r'_{2,}')
+
+@functools.lru_cache(maxsize=4096)
 def limpar_nome_arquivo(nome_arquivo):
     """Remove caracteres inválidos e substitui por '_'."""
     if not nome_arquivo:
         return 'sem_nome'
-        
-    chars_invalidos = ['<', '>', ':', '"', '/', '\\', '|', '?', '*', '\n', '\r']
-    nome_limpo = nome_arquivo
-    for char in chars_invalidos:
-        nome_limpo = nome_limpo.replace(char, '_')
-    
-    nome_limpo = re.sub(r'_{2,}', '_', nome_limpo)
+
+    nome_limpo = _REPEATED_UNDERSCORES.sub('_', nome_arquivo.translate(_INVALID_CHARS))
     
     return nome_limpo.strip('_')
 
-def get_cleaned_file_path(media, directory, chat_title, caption=None):
-    """Constrói o caminho completo e limpo para o arquivo de mídia."""
+@functools.lru_cache(maxsize=4096)
+def plan_file_name(caption, file_name, file_id):
+    """Nome (sem pasta) de uma mídia: legenda, nome original ou file_id, com a extensão original."""
     from config import UNKNOWN_EXTENSION
-    
+
     if caption:
         base_name = limpar_nome_arquivo(caption)
-    elif media.file_name:
-        base_parts = media.file_name.rsplit('.', 1)
-        base_name = limpar_nome_arquivo(base_parts[0]) if len(base_parts) > 1 else limpar_nome_arquivo(media.file_name)
+    elif file_name:
+        base_parts = file_name.rsplit('.', 1)
+        base_name = limpar_nome_arquivo(base_parts[0]) if len(base_parts) > 1 else limpar_nome_arquivo(file_name)
     else:
-        base_name = f"arquivo_{media.file_id}"
+        base_name = f"arquivo_{file_id}"
 
-    extension = media.file_name.split('.')[-1] if media.file_name and '.' in media.file_name else UNKNOWN_EXTENSION
-    clean_name = f"{base_name}.{extension}"
-    
+    extension = file_name.split('.')[-1] if file_name and '.' in file_name else UNKNOWN_EXTENSION
+    return f"{base_name}.{extension}"
+
+def get_cleaned_file_path(media, directory, chat_title, caption=None):
+    """Constrói o caminho completo e limpo para o arquivo de mídia."""
     chat_directory = os.path.join(directory, limpar_nome_arquivo(chat_title))
     
-    return os.path.join(chat_directory, clean_name)
-
-def save_last_processed_message_id(chat_title, channel_source, last_id):
-    """Salva o ID da última mensagem processada."""
-    if not os.path.exists(TASK_DIRECTORY):
-        os.makedirs(TASK_DIRECTORY)
-    safe_channel_source = limpar_nome_arquivo(str(channel_source)) 
-    json_filepath = f"{TASK_DIRECTORY}/{limpar_nome_arquivo(chat_title)}_{safe_channel_source}.json"
-    with open(json_filepath, 'w') as file:
-        json.dump({'last_processed_id': last_id}, file)
-
-def load_last_processed_message_id(chat_title, channel_source):
-    """Carrega o ID da última mensagem processada para retomar."""
-    safe_channel_source = limpar_nome_arquivo(str(channel_source))
-    json_filepath = f"{TASK_DIRECTORY}/{limpar_nome_arquivo(chat_title)}_{safe_channel_source}.json"
-    try:
-        with open(json_filepath, "r") as json_file:
-            data = json.load(json_file)
-            last_processed_id = data.get("last_processed_id", 0)
-            if last_processed_id > 0:
-                print(f"⚠️  Detectado progresso anterior no ID {last_processed_id + 1}")
-                print("🔄 Ignorando progresso anterior - iniciando do zero")
-            return 0
-    except FileNotFoundError:
-        print("▶️ Iniciando download do zero.")
-        return 0
+    return os.path.join(chat_directory, plan_file_name(caption, media.file_name, media.file_id))
+
+class FilenamePlanner:
+    """Escolhe um nome único e estável para cada mensagem de uma pasta.
+
+    Duas mensagens com o mesmo nome (ex: mesma legenda) não podem gravar no
+    mesmo arquivo: a primeira fica com o nome normal e as seguintes ganham o ID
+    da mensagem como sufixo. As escolhas são repassadas a on_assign para serem
+    gravadas, e assigned (mensagem -> nome) as restaura nas próximas execuções,
+    então cada mensagem sempre recebe o mesmo nome.
+    """
+
+    def __init__(self, directory, assigned=None, on_assign=None):
+        self.directory = directory
+        self._on_assign = on_assign
+        self._lock = threading.Lock()
+        self._by_message = {}
+        self._owners = {}
+        for message_id, name in (assigned or {}).items():
+            self._claim(message_id, name)
+
+    def _claim(self, message_id, name):
+        self._by_message[message_id] = name
+        # Windows não diferencia maiúsculas de minúsculas nos nomes
+        self._owners.setdefault(name.casefold(), message_id)
+
+    def path_for(self, record):
+        """Caminho do arquivo da mensagem, reservando o nome na primeira vez."""
+        with self._lock:
+            name = self._by_message.get(record.id)
+            if name is None:
+                name = plan_file_name(record.caption, record.file_name, record.file_id)
+                stem, extension = name.rsplit('.', 1)
+                if not stem:
+                    stem = f"arquivo_{record.id}"
+                    name = f"{stem}.{extension}"
+                while self._owners.get(name.casefold(), record.id) != record.id:
+                    stem = f"{stem}_{record.id}"
+                    name = f"{stem}.{extension}"
+                self._claim(record.id, name)
+                if self._on_assign:
+                    self._on_assign(record.id, name)
+            return os.path.join(self.directory, name)
+
+class DirectoryIndex:
+    """Índice nome → tamanho dos arquivos de um diretório.
+
+    Montado com uma única passada de os.scandir, evita um exists/getsize por
+    mensagem. Os downloads concluídos atualizam o índice em memória.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.normpath(directory)
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+        if os.path.isdir(directory):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        self._sizes[entry.name] = entry.stat().st_size
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def size_of(self, path):
+        """Tamanho do arquivo em path, ou None se não existir."""
+        directory, name = os.path.split(os.path.normpath(path))
+        if directory != self.directory:
+            return os.path.getsize(path) if os.path.exists(path) else None
+        with self._lock:
+            return self._sizes.get(name)
+
+    def is_complete(self, path, expected_size):
+        """Indica se o arquivo já existe com o tamanho esperado."""
+        return self.size_of(path) == expected_size
+
+    def add(self, path, size):
+        """Registra um arquivo recém-gravado."""
+        directory, name = os.path.split(os.path.normpath(path))
+        if directory == self.directory:
+            with self._lock:
+                self._sizes[name] = size
+
+def connect_read_only(path):
+    """Abre um banco SQLite que já existe só para leitura: nada é criado nem alterado."""
+    return sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True,
+                           check_same_thread=False)
+
+def preallocate_file(f, size):
+    """Reserva o tamanho final do arquivo aberto f de uma vez, evitando fragmentação.
+
+    Usa posix_fallocate onde existe; sem ele (Windows) ou se o sistema de
+    arquivos não suporta, só ajusta o tamanho com truncate.
+    """
+    if size and PREALLOCATE_FILES and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+    f.truncate(size)
+
+def fsync_file(path):
+    """Garante que o conteúdo de path está no disco (antes de renomeá-lo para o nome final)."""
+    if not FSYNC_FILES:
+        return
+    with open(path, 'r+b') as f:
+        os.fsync(f.fileno())
+
+def fsync_handle(f):
+    """Como fsync_file, para um arquivo aberto: esvazia o buffer do Python e leva ao disco."""
+    f.flush()
+    if FSYNC_FILES:
+        os.fsync(f.fileno())
+
+class DirectorySyncer:
+    """Agrupa os fsync de diretório que tornam as renomeações duráveis.
+
+    Um os.replace só sobrevive a uma queda de energia depois do fsync do
+    diretório; em vez de um por arquivo, os diretórios pendentes são
+    sincronizados juntos no máximo a cada interval segundos e no fim de cada
+    pool de downloads. No Windows diretórios não podem ser abertos: nada é feito.
+    """
+
+    def __init__(self, interval=DIRECTORY_FSYNC_INTERVAL):
+        self.interval = interval
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def schedule(self, path):
+        """Registra que path acabou de ser criado ou renomeado."""
+        if not FSYNC_FILES or os.name == 'nt':
+            return
+        with self._lock:
+            self._pending.add(os.path.dirname(os.path.abspath(path)))
+            due = time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Sincroniza agora todos os diretórios pendentes."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            self._last_flush = time.monotonic()
+        for directory in pending:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                tqdm.write(f"⚠️  Erro ao sincronizar o diretório {directory}: {e}")
+
+# Diretórios com renomeações ainda não sincronizadas, de todos os downloads do processo
+directory_syncer = DirectorySyncer()
+
+def run_in_client_loop(client, func, *args):
+    """Executa func numa thread auxiliar mantendo o loop do cliente ativo.
+
+    Os métodos síncronos do Pyrogram só funcionam fora da thread principal
+    enquanto o loop do cliente estiver rodando nela.
+    """
+    loop = getattr(client, 'loop', None)
+    if loop is None or loop.is_running():
+        return func(*args)
+    return loop.run_until_complete(asyncio.to_thread(func, *args))
+
+def run_coroutine(client, coroutine):
+    """Executa uma corrotina do Pyrogram (sem versão síncrona) no loop do cliente."""
+    loop = client.loop
+    if loop.is_running():
+        # Chamado de uma thread auxiliar (run_in_client_loop): o loop roda na principal
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+    return loop.run_until_complete(coroutine)
+
+def iter_in_background(iterable, maxsize, on_depth=None):
+    """Consome iterable numa thread separada através de uma fila limitada.
+
+    Quem itera recebe os itens assim que ficam prontos, enquanto a produção
+    continua em paralelo e para quando a fila enche. on_depth(n) recebe o
+    tamanho da fila a cada item entregue.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    done = object()
+    failure = []
+
+    def producer():
+        try:
+            for item in iterable:
+                buffer.put(item)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            buffer.put(done)
+
+    threading.Thread(target=producer, daemon=True).start()
+
+    while True:
+        item = buffer.get()
+        if item is done:
+            break
+        if on_depth:
+            on_depth(buffer.qsize())
+        yield item
+
+    if on_depth:
+        on_depth(0)
+
+    if failure:
+        raise failure[0]
 
 def show_banner():
     print("╔══════════════════════════════════════════════╗")